@@ -1,5 +1,6 @@
 import logging
 from django.conf import settings
+from pymongo.errors import OperationFailure
 
 
 brands_collection=settings.MONGO_DB["brands"]
@@ -11,6 +12,25 @@ brands_collection.create_index("brand_code", unique=True)
 models_collection.create_index([("brand_id", 1), ("model_code", 1)], unique=True)
 categories_collection.create_index([("model_id", 1), ("category_code", 1)], unique=True)
 products_collection.create_index([("category_id", 1), ("product_code", 1)], unique=True)
+products_collection.create_index(
+    [("brand_code", 1), ("model_code", 1), ("category_code", 1), ("product_code", 1)],
+    unique=True, partialFilterExpression={"brand_code": {"$exists": True}}
+)
+brands_collection.create_index([("brand_code", 1), ("_id", 1)])
+models_collection.create_index([("brand_id", 1), ("model_code", 1), ("_id", 1)])
+categories_collection.create_index([("model_id", 1), ("category_code", 1), ("_id", 1)])
+product_path=[("brand_code", 1), ("model_code", 1), ("category_code", 1)]
+for sort_field in ("product_code", "effective_price", "product_name", "created_at"):
+    products_collection.create_index(product_path+[(sort_field, 1), ("_id", 1)])
+product_text=product_path+[("product_name", "text"), ("product_code", "text"), ("description", "text")]
+product_text_weights={"product_name": 10, "product_code": 5, "description": 1}
+try:
+    products_collection.create_index(product_text, weights=product_text_weights, name="product_text")
+except OperationFailure:
+    products_collection.drop_index("product_text")
+    products_collection.create_index(product_text, weights=product_text_weights, name="product_text")
+products_collection.create_index("next_price_transition", sparse=True)
+products_collection.create_index("code", unique=True, partialFilterExpression={"code": {"$type": "string"}})
 
 carts_collection=settings.MONGO_DB["carts"]
 
@@ -20,6 +40,8 @@ temporary_users_collection=settings.MONGO_DB["temporary_users"]
 
 blacklisted_tokens_collection=settings.MONGO_DB["blacklisted_tokens"]
 
+checkpoints_collection=settings.MONGO_DB["watcher_checkpoints"]
+
 logger=logging.getLogger("admin_events")
 logger.setLevel(logging.INFO)
 if not logger.handlers:
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+from pymongo.errors import OperationFailure
+from .admin import *
+
+history_lost_codes={136, 280, 286}
+
+
+def load_checkpoint(name):
+    doc=checkpoints_collection.find_one({"_id": name})
+    return doc.get("resume_token") if doc else None
+
+def save_checkpoint(name, token):
+    checkpoints_collection.update_one(
+        {"_id": name},
+        {"$set": {"resume_token": token, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+def clear_checkpoint(name):
+    checkpoints_collection.delete_one({"_id": name})
+
+def is_history_lost(error):
+    return isinstance(error, OperationFailure) and error.code in history_lost_codes
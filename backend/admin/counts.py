@@ -0,0 +1,73 @@
+from collections import Counter
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from .admin import *
+
+counter_fields={"product_count", "reserved"}
+levels=[
+    (brands_collection, "brand_code"),
+    (models_collection, "model_code"),
+    (categories_collection, "category_code"),
+]
+
+
+def is_counter_update(change):
+    if change["operationType"]!="update":
+        return False
+    description=change.get("updateDescription") or {}
+    updated=set(description.get("updatedFields") or {})
+    return bool(updated) and updated<=counter_fields and not description.get("removedFields")
+
+def ancestors_from_db(category_id):
+    category=categories_collection.find_one({"_id": category_id}, {"model_id": 1})
+    if not category:
+        return None
+    model=models_collection.find_one({"_id": category["model_id"]}, {"brand_id": 1})
+    if not model:
+        return None
+    return [category_id, model["_id"], model["brand_id"]]
+
+def apply_product_delta(ancestors, delta):
+    for coll, node_id in zip((categories_collection, models_collection, brands_collection), ancestors):
+        coll.update_one({"_id": node_id}, {"$inc": {"product_count": delta}})
+
+def recount_ancestors(path, ancestors):
+    for depth, node_id in zip(range(len(path)-1, 0, -1), ancestors):
+        coll=levels[depth-1][0]
+        query={code_field: code for (_, code_field), code in zip(levels, path[:depth])}
+        count=products_collection.count_documents(query)
+        coll.update_one({"_id": node_id, "product_count": {"$ne": count}}, {"$set": {"product_count": count}})
+
+def reconcile_product_counts():
+    try:
+        category_counts=Counter({
+            row["_id"]: row["count"] for row in
+            products_collection.aggregate([{"$group": {"_id": "$category_id", "count": {"$sum": 1}}}])
+        })
+        categories=list(categories_collection.find({}, {"model_id": 1, "product_count": 1}))
+        models=list(models_collection.find({}, {"brand_id": 1, "product_count": 1}))
+        brands=list(brands_collection.find({}, {"product_count": 1}))
+        model_counts=Counter()
+        for category in categories:
+            model_counts[category["model_id"]]+=category_counts[category["_id"]]
+        brand_counts=Counter()
+        for model in models:
+            brand_counts[model["brand_id"]]+=model_counts[model["_id"]]
+        drift=0
+        for coll, docs, counts in (
+            (categories_collection, categories, category_counts),
+            (models_collection, models, model_counts),
+            (brands_collection, brands, brand_counts),
+        ):
+            ops=[
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"product_count": counts[doc["_id"]]}})
+                for doc in docs if doc.get("product_count")!=counts[doc["_id"]]
+            ]
+            if ops:
+                coll.bulk_write(ops, ordered=False)
+                drift+=len(ops)
+        logger.info(f"[PRODUCT COUNTS] reconciled {len(categories)} categories, {len(models)} models, {len(brands)} brands; fixed {drift} counters")
+        return drift
+    except PyMongoError as e:
+        logger.error(f"[PRODUCT COUNTS ERROR] reconciliation failed: {e}")
+        return 0
@@ -1,23 +1,67 @@
 import threading
 import time
 from bson import ObjectId
+from django.conf import settings
 from datetime import datetime, timezone, timedelta
 from pymongo.errors import PyMongoError
 from pymongo import UpdateOne
 from client.models import Cart
+from client.pricebook import pricebook
+from client.demand import Demand
+from client.reservations import Reservation
+from utility.cache import response_cache
 from .admin import *
+from .checkpoints import clear_checkpoint, is_history_lost, load_checkpoint, save_checkpoint
+from .counts import ancestors_from_db, apply_product_delta, is_counter_update, recount_ancestors, reconcile_product_counts
+from .pricing import apply_due_transitions, next_transition_at
+from .resolver import resolver
+from .search import catalog_index
+from .snapshot import catalog_snapshot
+from .versions import catalog_versions
 
 
-collections=[
+price_schedule_changed=threading.Event()
+# last seen stock > reserved per product; unknown products count as a change
+stock_states={}
+
+catalog_collections=[
+    brands_collection,
+    models_collection,
+    categories_collection,
+    products_collection
+]
+
+audited_collections=[
     brands_collection,
     models_collection,
     categories_collection,
     products_collection,
     temporary_users_collection,
-    blacklisted_tokens_collection,
-    audits_collection
+    blacklisted_tokens_collection
 ]
 
+handlers={}
+reset_handlers={}
+
+def register(coll, handler, reset=None):
+    handlers.setdefault(coll.name, []).append(handler)
+    if reset is not None:
+        reset_handlers.setdefault(coll.name, []).append(reset)
+
+def run_resets(names):
+    resets=dict.fromkeys(reset for name in names for reset in reset_handlers.get(name, ()))
+    for reset in resets:
+        reset()
+
+def dispatch(change):
+    name=change["ns"]["coll"]
+    for handler in handlers.get(name, ()):
+        try:
+            handler(change)
+        except Exception as e:
+            logger.exception(f"[DISPATCH ERROR] {handler.__name__} failed on {name} {change['documentKey']['_id']}: {e}")
+            run_resets([name])
+
 def log_audit(change, admin_id=None):
     audit_doc={
         "collection": change["ns"]["coll"],
@@ -52,6 +96,10 @@ def handle_stock_decrease(product_id: ObjectId, new_stock: int):
         handle_product_delete(product_id)
         logger.warning(f"[ZERO STOCK] product {product_id} removed from all carts (out of stock)")
         return
+    demand, carts=Demand.get(product_id)
+    if demand<=new_stock:
+        return
+    logger.warning(f"[STOCK PRESSURE] product {product_id}: demand {demand} across {carts} carts > stock {new_stock}")
     affected_carts=list(carts_collection.find({"items.product_id": product_id}))
     if not affected_carts:
         return
@@ -71,6 +119,8 @@ def handle_stock_decrease(product_id: ObjectId, new_stock: int):
                 total_requested+=qty
     if total_requested==0 or total_requested<=new_stock:
         logger.info(f"[STOCK OK] total requested ({total_requested}) <= stock ({new_stock})")
+        Demand.set(product_id, total_requested, len(user_requests))
+        Reservation.reconcile([product_id])
         return
     for req in user_requests:
         exact_share=(req["requested"]/total_requested)*new_stock
@@ -101,6 +151,7 @@ def handle_stock_decrease(product_id: ObjectId, new_stock: int):
             {"_id": cart_id},
             {"$set": {"items": new_items, "subtotal": new_subtotal, "updated_at": now}}
         ))
+        Reservation.set_held(cart["user_id"], product_id, new_qty)
         logger.info(f"[ADJUST CART] cart {cart_id}: product {product_id} quantity set to {new_qty}")
     if bulk_ops:
         carts_collection.bulk_write(bulk_ops)
@@ -112,11 +163,15 @@ def handle_stock_decrease(product_id: ObjectId, new_stock: int):
             "new_stock": new_stock,
             "timestamp": now
         })
+    Demand.set(product_id, sum(r["allocated"] for r in user_requests), sum(1 for r in user_requests if r["allocated"]>0))
+    Reservation.reconcile([product_id])
 
 def handle_product_update(change):
     updated_fields=change.get("updateDescription", {}).get("updatedFields", {})
     product_id=change["documentKey"]["_id"]
-    if "price" in updated_fields or any(k.startswith("offers") for k in updated_fields.keys()):
+    if "next_price_transition" in updated_fields:
+        price_schedule_changed.set()
+    if "price" in updated_fields or "effective_price" in updated_fields or any(k.startswith("offers") for k in updated_fields.keys()):
         recalculate_cart_subtotals(product_id)
     if "stock" in updated_fields:
         new_stock=int(updated_fields["stock"])
@@ -124,6 +179,8 @@ def handle_product_update(change):
 
 def handle_product_delete(product_id: ObjectId):
     now=datetime.now(timezone.utc)
+    Reservation.release_product(product_id)
+    Demand.discard(product_id)
     affected_carts=carts_collection.find({"items.product_id": product_id})
     for cart in affected_carts:
         new_items=[item for item in cart["items"] if item["product_id"]!=product_id]
@@ -134,6 +191,96 @@ def handle_product_delete(product_id: ObjectId):
         )
         logger.info(f"[CLEANUP CART] removed product {product_id} from cart {cart['_id']}")
 
+def catalog_path(doc_id):
+    path=catalog_index.path(doc_id)
+    return tuple(path.values()) if path else None
+
+def invalidate_responses(*paths):
+    paths={path for path in paths if path is not None}
+    if not paths or not catalog_index.built:
+        response_cache.clear()
+        return
+    for path in paths:
+        response_cache.invalidate_node(path)
+
+def invalidate_snapshot(change, *paths):
+    paths={path for path in paths if path}
+    if not paths or not catalog_index.built:
+        catalog_snapshot.reset()
+        return
+    products_only=change["ns"]["coll"]==products_collection.name
+    for path in paths:
+        catalog_snapshot.invalidate(path, products_only=products_only)
+
+def crossed_stock_boundary(change):
+    doc=change.get("fullDocument")
+    if not doc:
+        return False
+    in_stock=doc.get("stock", 0)>doc.get("reserved", 0)
+    previous=stock_states.get(doc["_id"])
+    stock_states[doc["_id"]]=in_stock
+    return previous!=in_stock
+
+def handle_counter_update(change):
+    doc_id=change["documentKey"]["_id"]
+    if change["ns"]["coll"]==products_collection.name:
+        if "reserved" in change["updateDescription"]["updatedFields"] and crossed_stock_boundary(change):
+            path=catalog_path(doc_id)
+            invalidate_responses(path)
+            if path is None:
+                catalog_versions.reset()
+            catalog_versions.touch(path)
+        return
+    path=catalog_path(doc_id)
+    if path is None:
+        response_cache.clear()
+        return
+    response_cache.invalidate(path[:-1], descendants=False)
+    catalog_versions.touch_list(path[:-1])
+
+def update_product_counts(change, old_ancestors, new_ancestors):
+    operation=change["operationType"]
+    try:
+        if operation=="insert":
+            ancestors=new_ancestors or ancestors_from_db(change["fullDocument"]["category_id"])
+            if ancestors:
+                apply_product_delta(ancestors, 1)
+        elif operation=="delete" and old_ancestors:
+            apply_product_delta(old_ancestors, -1)
+    except PyMongoError as e:
+        logger.error(f"[PRODUCT COUNTS ERROR] {operation} {change['documentKey']['_id']}: {e}")
+
+def handle_catalog_change(change):
+    doc_id=change["documentKey"]["_id"]
+    if is_counter_update(change):
+        handle_counter_update(change)
+        return
+    stock_states.pop(doc_id, None)
+    old_path=catalog_path(doc_id)
+    old_ancestors=catalog_index.ancestors(doc_id)
+    catalog_index.apply_change(change)
+    new_path=catalog_path(doc_id)
+    invalidate_responses(old_path, new_path)
+    invalidate_snapshot(change, old_path, new_path)
+    if not catalog_index.built:
+        catalog_versions.reset()
+    catalog_versions.touch(old_path)
+    if new_path!=old_path:
+        catalog_versions.touch(new_path)
+    if change["ns"]["coll"]==products_collection.name:
+        update_product_counts(change, old_ancestors, catalog_index.ancestors(doc_id))
+        return
+    if change["operationType"]=="insert":
+        return
+    if change["operationType"]=="delete" and old_path and old_ancestors:
+        try:
+            recount_ancestors(old_path, old_ancestors)
+        except PyMongoError as e:
+            logger.error(f"[PRODUCT COUNTS ERROR] recount after deleting {doc_id}: {e}")
+    evicted=resolver.invalidate(doc_id)
+    if evicted:
+        logger.info(f"[RESOLVER] evicted {evicted} cached paths for {change['ns']['coll']} {doc_id}")
+
 def cleanup_temp_users(days: int=1):
     cutoff=datetime.now(timezone.utc)-timedelta(days=days)
     try:
@@ -164,34 +311,185 @@ def start_cleanup(interval_sec=3600):
             cleanup_temp_users(1)
             cleanup_old_tokens(7)
             cleanup_old_audits(30)
+            reconcile_product_counts()
+            reconcile_reservations()
+            rebuild_demand()
             time.sleep(interval_sec)
     t=threading.Thread(target=run, daemon=True)
     t.start()
     logger.info("[PERIODIC CLEANUP] background cleanup thread started")
 
-def watch_collection(coll):
-    pipeline=[{"$match": {"operationType": {"$in": ["insert", "update", "delete"]}}}]
+def reconcile_reservations():
+    try:
+        fixed=Reservation.reconcile()
+        logger.info(f"[RESERVATIONS] reconciled reserved counters, fixed {fixed} products")
+    except PyMongoError as e:
+        logger.error(f"[RESERVATIONS ERROR] reconciliation failed: {e}")
+
+def rebuild_demand():
+    try:
+        products=Demand.rebuild()
+        logger.info(f"[PRODUCT DEMAND] rebuilt demand index for {products} products")
+    except PyMongoError as e:
+        logger.error(f"[PRODUCT DEMAND ERROR] rebuild failed: {e}")
+
+def start_hold_sweeper(interval_sec=30):
+    def run():
+        while True:
+            more=False
+            try:
+                carts, more=Reservation.expire()
+                for user_id, quantities in carts.items():
+                    Cart.release_lines(user_id, quantities)
+                if carts:
+                    logger.info(f"[HOLD SWEEPER] released expired holds in {len(carts)} carts")
+            except PyMongoError as e:
+                logger.error(f"[HOLD SWEEPER ERROR] {e}")
+            if not more:
+                time.sleep(interval_sec)
+    t=threading.Thread(target=run, daemon=True)
+    t.start()
+    logger.info("[HOLD SWEEPER] expired stock hold sweeper started")
+
+def start_price_scheduler(max_sleep=60):
+    def run():
+        while True:
+            price_schedule_changed.clear()
+            more=False
+            upcoming=None
+            try:
+                applied, more=apply_due_transitions()
+                if applied:
+                    logger.info(f"[PRICE SCHEDULER] applied {applied} offer transitions")
+                upcoming=next_transition_at()
+            except PyMongoError as e:
+                logger.error(f"[PRICE SCHEDULER ERROR] {e}")
+            if more:
+                continue
+            delay=max_sleep if upcoming is None else min(max_sleep, max(0, upcoming-time.time()))
+            price_schedule_changed.wait(delay)
+    t=threading.Thread(target=run, daemon=True)
+    t.start()
+    logger.info("[PRICE SCHEDULER] offer transition scheduler started")
+
+def audit_change(change):
+    if not is_counter_update(change):
+        log_audit(change)
+
+def handle_product_change(change):
+    if change["operationType"]=="update":
+        handle_product_update(change)
+    elif change["operationType"]=="delete":
+        handle_product_delete(change["documentKey"]["_id"])
+
+def reset_catalog_caches():
+    stock_states.clear()
+    resolver.clear()
+    response_cache.clear()
+    catalog_snapshot.reset()
+    catalog_versions.reset()
+
+for coll in audited_collections:
+    register(coll, audit_change)
+for coll in catalog_collections:
+    register(coll, handle_catalog_change, reset=reset_catalog_caches)
+register(products_collection, pricebook.apply_change, reset=pricebook.clear)
+register(products_collection, handle_product_change)
+
+def forces_checkpoint(change):
+    return change["ns"]["coll"]==products_collection.name and change["operationType"]!="update"
+
+def recalculate_all_cart_subtotals():
+    now=datetime.now(timezone.utc)
+    ops=[]
+    for cart in carts_collection.find({"items.0": {"$exists": True}}, {"items": 1, "subtotal": 1}):
+        subtotal=Cart.calculate_subtotal(cart["items"])
+        if subtotal!=cart.get("subtotal"):
+            ops.append(UpdateOne({"_id": cart["_id"]}, {"$set": {"subtotal": subtotal, "updated_at": now}}))
+    if ops:
+        carts_collection.bulk_write(ops, ordered=False)
+    logger.info(f"[RESYNC] recalculated {len(ops)} cart subtotals")
+
+def resync_after_history_loss():
+    run_resets(list(reset_handlers))
+    try:
+        catalog_index.build()
+        recalculate_all_cart_subtotals()
+    except PyMongoError as e:
+        logger.error(f"[RESYNC ERROR] {e}")
+    reconcile_product_counts()
+    reconcile_reservations()
+    rebuild_demand()
+
+def watch_database(name="events"):
+    config=settings.WATCHER_CHECKPOINT
+    pipeline=[{"$match": {
+        "ns.coll": {"$in": list(handlers)},
+        "operationType": {"$in": ["insert", "update", "delete"]}
+    }}]
+    token=None
+    try:
+        token=load_checkpoint(name)
+    except PyMongoError as e:
+        logger.error(f"[WATCH ERROR] could not load checkpoint {name}: {e}")
+    if token:
+        logger.info(f"[WATCHER RESUMED] resuming {name} stream from saved checkpoint")
+    # replayed deletes miss the index entries the startup build already dropped, so recount once caught up
+    recount_pending=bool(token)
+    saved_token=token
     while True:
+        pending=0
+        saved_at=time.monotonic()
         try:
-            with coll.watch(pipeline=pipeline, full_document="updateLookup") as stream:
-                for change in stream:
-                    if coll!=audits_collection:
-                        log_audit(change)
-                    if coll==products_collection:
-                        if change["operationType"]=="update":
-                            handle_product_update(change)
-                        elif change["operationType"]=="delete":
-                            handle_product_delete(change["documentKey"]["_id"])
+            with settings.MONGO_DB.watch(pipeline=pipeline, full_document="updateLookup", resume_after=token) as stream:
+                while stream.alive:
+                    change=stream.try_next()
+                    if change is not None:
+                        dispatch(change)
+                        pending+=1
+                    elif recount_pending:
+                        recount_pending=False
+                        logger.info(f"[WATCHER RESUMED] {name} replay caught up, reconciling product counts")
+                        reconcile_product_counts()
+                    token=stream.resume_token or token
+                    if token==saved_token:
+                        continue
+                    if pending>=config["EVENTS"] or time.monotonic()-saved_at>=config["SECONDS"] or (change is not None and forces_checkpoint(change)):
+                        save_checkpoint(name, token)
+                        saved_token=token
+                        pending=0
+                        saved_at=time.monotonic()
         except PyMongoError as e:
-            logger.error(f"[WATCH ERROR] {coll.name}: {e}. retrying...")
+            if is_history_lost(e):
+                logger.error(f"[WATCH HISTORY LOST] checkpoint for {name} is no longer in the oplog: {e}. resyncing and restarting from now")
+                token=saved_token=None
+                recount_pending=False
+                try:
+                    clear_checkpoint(name)
+                except PyMongoError as error:
+                    logger.error(f"[WATCH ERROR] could not clear checkpoint {name}: {error}")
+                resync_after_history_loss()
+                continue
+            logger.error(f"[WATCH ERROR] {e}. retrying...")
             time.sleep(5)
         except Exception as e:
-            logger.exception(f"[WATCH ERROR] unexpected error on {coll.name}: {e}. retrying...")
+            logger.exception(f"[WATCH ERROR] unexpected error: {e}. retrying...")
             time.sleep(5)
+        if token is None:
+            run_resets(list(reset_handlers))
 
 def start_watchers():
     start_cleanup()
-    for coll in collections:
-        t=threading.Thread(target=watch_collection, args=(coll,), daemon=True)
-        t.start()
-        logger.info(f"[WATCHER STARTED] watching collection {coll.name}")
+    start_price_scheduler()
+    start_hold_sweeper()
+    try:
+        catalog_index.build()
+    except PyMongoError as e:
+        logger.error(f"[CATALOG INDEX ERROR] initial build failed, retrying in the background on first search: {e}")
+    t=threading.Thread(target=watch_database, daemon=True)
+    t.start()
+    logger.info(f"[WATCHER STARTED] watching collections {', '.join(handlers)}")
+    catalog_versions.live=True
+    resolver.live=True
+    catalog_index.live=True
+    pricebook.live=True
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from admin.admin import *
+from admin.pricing import pricing_update
+
+
+class Command(BaseCommand):
+    help="backfill effective_price and next_price_transition on product documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--all", action="store_true", help="recompute every product, not only documents missing effective_price")
+
+    def handle(self, *args, **options):
+        chunk_size=options["chunk_size"]
+        base_query={} if options["all"] else {"effective_price": {"$exists": False}}
+        last_id=None
+        updated=0
+        while True:
+            query=dict(base_query)
+            if last_id is not None:
+                query["_id"]={"$gt": last_id}
+            docs=list(products_collection.find(query, {"price": 1, "offers": 1}).sort("_id", 1).limit(chunk_size))
+            if not docs:
+                break
+            now=time.time()
+            ops=[UpdateOne({"_id": doc["_id"]}, pricing_update(doc.get("price"), doc.get("offers"), now)) for doc in docs]
+            updated+=products_collection.bulk_write(ops, ordered=False).modified_count
+            last_id=docs[-1]["_id"]
+            self.stdout.write(f"[BACKFILL] {updated} products updated")
+        self.stdout.write(self.style.SUCCESS(f"backfill complete: {updated} products updated"))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from admin.admin import *
+
+
+class Command(BaseCommand):
+    help="backfill brand_code, model_code and category_code on product documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--all", action="store_true", help="re-sync every product, not only documents missing codes")
+
+    def handle(self, *args, **options):
+        chunk_size=options["chunk_size"]
+        brand_codes={d["_id"]: d["brand_code"] for d in brands_collection.find({}, {"brand_code": 1})}
+        model_paths={
+            d["_id"]: (brand_codes.get(d["brand_id"]), d["model_code"])
+            for d in models_collection.find({}, {"brand_id": 1, "model_code": 1})
+        }
+        category_paths={
+            d["_id"]: model_paths.get(d["model_id"], (None, None))+(d["category_code"],)
+            for d in categories_collection.find({}, {"model_id": 1, "category_code": 1})
+        }
+        base_query={} if options["all"] else {"brand_code": {"$exists": False}}
+        last_id=None
+        updated=0
+        orphans=0
+        while True:
+            query=dict(base_query)
+            if last_id is not None:
+                query["_id"]={"$gt": last_id}
+            docs=list(products_collection.find(query, {"category_id": 1, "product_code": 1}).sort("_id", 1).limit(chunk_size))
+            if not docs:
+                break
+            ops=[]
+            for doc in docs:
+                path=category_paths.get(doc.get("category_id"))
+                if not path or None in path:
+                    orphans+=1
+                    continue
+                brand_code, model_code, category_code=path
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                    "brand_code": brand_code,
+                    "model_code": model_code,
+                    "category_code": category_code,
+                    "code": f"{brand_code}-{model_code}-{category_code}-{doc['product_code']}"
+                }}))
+            if ops:
+                updated+=products_collection.bulk_write(ops, ordered=False).modified_count
+            last_id=docs[-1]["_id"]
+            self.stdout.write(f"[BACKFILL] {updated} products updated, {orphans} orphans skipped")
+        self.stdout.write(self.style.SUCCESS(f"backfill complete: {updated} products updated, {orphans} orphans skipped"))
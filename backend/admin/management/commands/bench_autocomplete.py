@@ -0,0 +1,89 @@
+import random
+import time
+import tracemalloc
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from admin.search import CatalogIndex, PrefixIndex
+
+WORDS=[
+    "brake", "pad", "disc", "clutch", "plate", "filter", "oil", "air", "spark", "plug", "head", "lamp",
+    "mirror", "bumper", "radiator", "gasket", "bearing", "chain", "sprocket", "cable", "horn", "seat",
+    "cover", "shock", "absorber", "piston", "ring", "valve", "belt", "pump", "front", "rear", "left", "right",
+]
+
+
+def synthetic_entries(rng, products, brands=40, models_per_brand=25, categories_per_model=12):
+    entries=[]
+    categories=[]
+    for b in range(brands):
+        brand_id=ObjectId()
+        entries.append({"type": "brand", "_id": brand_id, "name": f"Brand {b}", "code": f"B{b}", "full_code": None, "parent_id": None})
+        for m in range(models_per_brand):
+            model_id=ObjectId()
+            entries.append({"type": "model", "_id": model_id, "name": f"Model {b} {m}", "code": f"M{m}", "full_code": None, "parent_id": brand_id})
+            for c in range(categories_per_model):
+                category_id=ObjectId()
+                name=" ".join(rng.sample(WORDS, 2))
+                entries.append({"type": "category", "_id": category_id, "name": name, "code": f"C{c}", "full_code": None, "parent_id": model_id})
+                categories.append(category_id)
+    for p in range(products):
+        name=" ".join(rng.sample(WORDS, 3))
+        entries.append({
+            "type": "product", "_id": ObjectId(), "name": name, "code": f"P{p}",
+            "full_code": f"B-M-C-P{p}", "parent_id": rng.choice(categories),
+        })
+    return entries
+
+
+class Command(BaseCommand):
+    help="benchmark autocomplete latency and memory on a synthetic catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng=random.Random(options["seed"])
+        entries=synthetic_entries(rng, options["products"])
+        self.stdout.write(f"[BENCH] {len(entries)} catalog entries")
+
+        tracemalloc.start()
+        started=time.perf_counter()
+        prefixes=PrefixIndex()
+        prefixes.load(entries, CatalogIndex.rank)
+        prefix_build=time.perf_counter()-started
+        prefix_memory, _=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"[BENCH] prefix array: {len(prefixes)} keys, {prefix_memory/2**20:.1f} MiB, built in {prefix_build*1000:.0f} ms")
+
+        tracemalloc.start()
+        started=time.perf_counter()
+        index=CatalogIndex()
+        index.load(entries)
+        index_build=time.perf_counter()-started
+        index_memory, _=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"[BENCH] full catalog index: {index_memory/2**20:.1f} MiB, built in {index_build*1000:.0f} ms")
+
+        queries=[rng.choice(WORDS)[:rng.randint(1, 5)] for _ in range(options["queries"])]
+        timings=[]
+        for query in queries:
+            started=time.perf_counter()
+            index.autocomplete(query, limit=10)
+            timings.append(time.perf_counter()-started)
+        timings.sort()
+        total=sum(timings)
+        self.stdout.write(
+            f"[BENCH] autocomplete: p50 {timings[len(timings)//2]*1e6:.0f} us, "
+            f"p99 {timings[int(len(timings)*0.99)]*1e6:.0f} us, {len(timings)/total:.0f} req/s"
+        )
+
+        categories=[entry["_id"] for entry in entries if entry["type"]=="category"]
+        started=time.perf_counter()
+        updates=1000
+        for p in range(updates):
+            doc={"_id": ObjectId(), "product_name": " ".join(rng.sample(WORDS, 3)), "product_code": f"N{p}", "category_id": rng.choice(categories)}
+            index.apply_change({"ns": {"coll": "products"}, "operationType": "insert", "documentKey": {"_id": doc["_id"]}, "fullDocument": doc})
+        elapsed=time.perf_counter()-started
+        self.stdout.write(f"[BENCH] incremental insert: {elapsed/updates*1e6:.0f} us per product")
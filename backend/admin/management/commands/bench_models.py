@@ -0,0 +1,39 @@
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from admin.models import Product
+from .bench_serializers import synthetic_products
+
+
+class Command(BaseCommand):
+    help="benchmark per-object memory and construction speed of Product instances"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def measure(self, cls, docs):
+        tracemalloc.start()
+        started=time.perf_counter()
+        objects=[Product.from_dict.__func__(cls, doc) for doc in docs]
+        elapsed=time.perf_counter()-started
+        memory, _=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return objects, memory, elapsed
+
+    def handle(self, *args, **options):
+        docs=synthetic_products(random.Random(options["seed"]), options["products"])
+        for doc in docs:
+            doc.pop("reviews")
+            doc.pop("offers")
+        legacy=type("DictProduct", (), {"__init__": Product.__init__})
+        self.stdout.write(f"[BENCH] {len(docs)} products")
+        for label, cls in (("__dict__", legacy), ("__slots__", Product)):
+            objects, memory, elapsed=self.measure(cls, docs)
+            self.stdout.write(
+                f"[BENCH] {label}: {memory/2**20:.1f} MiB, {memory/len(objects):.0f} bytes per object "
+                f"(including reviews/offers defaults), built in {elapsed*1000:.0f} ms "
+                f"({elapsed/len(objects)*1e6:.2f} us per object)"
+            )
+            del objects
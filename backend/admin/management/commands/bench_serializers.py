@@ -0,0 +1,64 @@
+import random
+import time
+from datetime import datetime, timezone, timedelta
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from admin.models import Product
+from utility.renderers import FastJSONRenderer
+from utility.serializers import orjson, serialize_product
+from .bench_autocomplete import WORDS
+
+
+def synthetic_products(rng, count):
+    now=datetime.now(timezone.utc)
+    category_id=ObjectId()
+    return [{
+        "_id": ObjectId(),
+        "category_id": category_id,
+        "brand_code": "B1", "model_code": "M1", "category_code": "C1",
+        "product_name": " ".join(rng.sample(WORDS, 3)),
+        "product_code": f"P{p}",
+        "code": f"B1-M1-C1-P{p}",
+        "description": " ".join(rng.sample(WORDS, 12)),
+        "price": round(rng.uniform(50, 5000), 2),
+        "stock": rng.randint(0, 500),
+        "image_url": f"https://res.cloudinary.com/demo/image/upload/products/p{p}.jpg",
+        "created_at": now-timedelta(minutes=p),
+        "reviews": [],
+        "offers": {},
+    } for p in range(count)]
+
+
+class Command(BaseCommand):
+    help="benchmark per-document serialization cost of product list responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1000)
+        parser.add_argument("--rounds", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def measure(self, build, render, docs, rounds):
+        timings=[]
+        for _ in range(rounds):
+            started=time.perf_counter()
+            render({"products": build(docs), "next_cursor": None})
+            timings.append(time.perf_counter()-started)
+        timings.sort()
+        return timings[len(timings)//2]
+
+    def handle(self, *args, **options):
+        docs=synthetic_products(random.Random(options["seed"]), options["items"])
+        rounds=options["rounds"]
+        legacy=JSONRenderer().render
+        fast=FastJSONRenderer().render
+        self.stdout.write(f"[BENCH] {len(docs)} products per list, {rounds} rounds, encoder: {'orjson' if orjson else 'json'}")
+
+        before=self.measure(lambda docs: [Product.from_dict(doc).to_dict() for doc in docs], legacy, docs, rounds)
+        after=self.measure(lambda docs: [serialize_product(doc) for doc in docs], fast, docs, rounds)
+        self.stdout.write(f"[BENCH] from_dict/to_dict + JSONRenderer: {before*1000:.2f} ms per list, {before/len(docs)*1e6:.2f} us per doc")
+        self.stdout.write(f"[BENCH] serialize_product + FastJSONRenderer: {after*1000:.2f} ms per list, {after/len(docs)*1e6:.2f} us per doc")
+        self.stdout.write(f"[BENCH] speedup: {before/after:.1f}x")
+
+        if legacy({"products": [Product.from_dict(doc).to_dict() for doc in docs[:10]]})!=fast({"products": [serialize_product(doc) for doc in docs[:10]]}):
+            self.stdout.write(self.style.WARNING("[BENCH] rendered output differs between paths"))
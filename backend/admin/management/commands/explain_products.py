@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from admin.admin import *
+from admin.models import Product
+
+FILTERS={
+    "none": {},
+    "price range": {"min_price": 100, "max_price": 1000},
+    "in stock": {"in_stock": True},
+    "on offer": {"on_offer": True},
+    "in stock, price range": {"min_price": 100, "max_price": 1000, "in_stock": True},
+}
+
+
+def plan_stages(plan):
+    stages=[]
+    while plan:
+        stages.append(plan.get("indexName") and f"{plan['stage']}({plan['indexName']})" or plan["stage"])
+        plan=plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+
+class Command(BaseCommand):
+    help="explain every product list filter/sort combination for one category"
+
+    def add_arguments(self, parser):
+        parser.add_argument("brand_code")
+        parser.add_argument("model_code")
+        parser.add_argument("category_code")
+        parser.add_argument("--limit", type=int, default=20)
+
+    def handle(self, *args, **options):
+        path=Product.path_filter(options["brand_code"], options["model_code"], options["category_code"])
+        if not products_collection.find_one(path, {"_id": 1}):
+            raise CommandError("no products found for this category")
+        failures=0
+        for sort, (sort_field, direction) in Product.sort_options.items():
+            for label, params in FILTERS.items():
+                query={**path, **Product.list_filters(**params)}
+                explain=(
+                    products_collection.find(query)
+                    .sort([(sort_field, direction), ("_id", direction)])
+                    .limit(options["limit"]+1)
+                    .explain()
+                )
+                stages=plan_stages(explain["queryPlanner"]["winningPlan"])
+                stats=explain.get("executionStats", {})
+                blocking="SORT" in stages or "COLLSCAN" in stages
+                failures+=blocking
+                self.stdout.write(
+                    f"[EXPLAIN] sort={sort:<10} filter={label:<22} {' <- '.join(stages)} "
+                    f"keys={stats.get('totalKeysExamined')} docs={stats.get('totalDocsExamined')} "
+                    f"returned={stats.get('nReturned')}{'  [BLOCKING]' if blocking else ''}"
+                )
+        if failures:
+            raise CommandError(f"{failures} combinations are not served by an index in sort order")
+        self.stdout.write(self.style.SUCCESS("[EXPLAIN] every combination is served by a compound index"))
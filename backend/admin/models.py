@@ -1,12 +1,22 @@
+from bson import ObjectId
 from pymongo.errors import PyMongoError
 from datetime import datetime, timezone
 from client.models import Cart
+from client.pricebook import pricebook
 from utility.cloudinary import upload_image
+from utility.pagination import keyset_page
+from utility.projection import attach_counts, projection_for, select_fields
+from utility.serializers import serialize_brand, serialize_model, serialize_category, serialize_product
 from .admin import *
+from .pricing import pricing_update
+from .resolver import resolver
 import re
 
 
 class Brand:
+    __slots__=("id", "brand_name", "brand_code", "image_url", "created_at")
+    public_fields=("_id", "brand_name", "brand_code", "image_url", "created_at")
+
     def __init__(self, brand_name, brand_code, image_url, created_at=None, _id=None):
         self.id=_id
         self.brand_name=brand_name
@@ -34,14 +44,15 @@ class Brand:
         if not image_url or not isinstance(image_url, str):
             raise ValueError("invalid image_url: must be a non-empty string")
 
-    def to_dict(self):
-        return {
+    def to_dict(self, fields=None):
+        data={
             "_id": str(self.id) if self.id else None,
             "brand_name": self.brand_name,
             "brand_code": self.brand_code,
             "image_url": self.image_url,
             "created_at": str(self.created_at),
         }
+        return select_fields(data, fields)
 
     @classmethod
     def from_dict(cls, data):
@@ -54,10 +65,12 @@ class Brand:
         )
 
     @classmethod
-    def brands_list(cls, limit=20):
+    def brands_list(cls, limit=20, cursor=None, fields=None, include_counts=False):
+        required=("brand_code", "product_count") if include_counts else ("brand_code",)
         try:
-            docs=list(brands_collection.find().limit(limit))
-            return [cls.from_dict(doc).to_dict() for doc in docs]
+            docs, next_cursor=keyset_page(brands_collection, {}, "brand_code", limit, cursor, projection=projection_for(fields, *required))
+            brands=[serialize_brand(doc, fields) for doc in docs]
+            return (attach_counts(brands, docs) if include_counts else brands), next_cursor
         except PyMongoError as e:
             raise RuntimeError(f"database error: {e}")
 
@@ -90,47 +103,46 @@ class Brand:
         if model_ids:
             category_docs=list(categories_collection.find({"model_id": {"$in": model_ids}}, {"_id": 1}))
             category_ids=[d["_id"] for d in category_docs]
+        product_filter={"$or": [{"category_id": {"$in": category_ids}}, {"brand_code": brand_code}]}
         try:
             client=settings.MONGO_DB.client
             with client.start_session() as session:
                 with session.start_transaction():
-                    if category_ids:
-                        products_collection.delete_many({"category_id": {"$in": category_ids}}, session=session)
+                    products_collection.delete_many(product_filter, session=session)
                     if model_ids:
                         categories_collection.delete_many({"model_id": {"$in": model_ids}}, session=session)
                         models_collection.delete_many({"_id": {"$in": model_ids}}, session=session)
                     brands_collection.delete_one({"_id": brand_id}, session=session)
+            resolver.invalidate(brand_id)
             return True
         except Exception:
             try:
-                if category_ids:
-                    products_collection.delete_many({"category_id": {"$in": category_ids}})
+                products_collection.delete_many(product_filter)
                 if model_ids:
                     categories_collection.delete_many({"model_id": {"$in": model_ids}})
                     models_collection.delete_many({"_id": {"$in": model_ids}})
                 brands_collection.delete_one({"_id": brand_id})
+                resolver.invalidate(brand_id)
                 return True
             except PyMongoError as e:
                 raise RuntimeError(f"database error during cascade delete: {e}") from e
 
     @classmethod
-    def brand_fetch(cls, brand_code):
-        doc=brands_collection.find_one({"brand_code": brand_code})
+    def brand_fetch(cls, brand_code, fields=None):
+        doc=brands_collection.find_one({"brand_code": brand_code}, projection_for(fields))
         if not doc:
             raise ValueError("brand not found")
-        return cls.from_dict(doc).to_dict()
+        return serialize_brand(doc, fields)
     
     @classmethod
-    def brand_search(cls, query):
+    def brand_search(cls, query, limit=20, cursor=None, fields=None):
         try:
-            regex={"$regex": query, "$options": "i"}
-            docs=list(brands_collection.find(
-                {"$or": [
-                    {"brand_name": regex},
-                    {"brand_code": regex}
-                ]}
-            ))
-            return [cls.from_dict(doc).to_dict() for doc in docs]
+            regex={"$regex": re.escape(query), "$options": "i"}
+            docs, next_cursor=keyset_page(brands_collection, {"$or": [
+                {"brand_name": regex},
+                {"brand_code": regex}
+            ]}, "brand_code", limit, cursor, projection=projection_for(fields, "brand_code"))
+            return [serialize_brand(doc, fields) for doc in docs], next_cursor
         except PyMongoError as e:
             raise RuntimeError(f"database error during search: {e}")
     
@@ -162,6 +174,9 @@ class Brand:
 
 
 class Model:
+    __slots__=("id", "brand_id", "model_name", "model_code", "image_url", "created_at")
+    public_fields=("_id", "brand_id", "model_name", "model_code", "image_url", "created_at")
+
     def __init__(self, brand_id, model_name, model_code, image_url, created_at=None, _id=None):
         self.id=_id
         self.brand_id=brand_id
@@ -190,8 +205,8 @@ class Model:
         if not image_url or not isinstance(image_url, str):
             raise ValueError("invalid image_url: must be a non-empty string")
 
-    def to_dict(self):
-        return {
+    def to_dict(self, fields=None):
+        data={
             "_id": str(self.id) if self.id else None,
             "brand_id": str(self.brand_id),
             "model_name": self.model_name,
@@ -199,6 +214,7 @@ class Model:
             "image_url": self.image_url,
             "created_at": str(self.created_at),
         }
+        return select_fields(data, fields)
 
     @classmethod
     def from_dict(cls, data):
@@ -212,24 +228,22 @@ class Model:
         )
 
     @classmethod
-    def models_list(cls, brand_code, limit=20):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        docs=list(models_collection.find({"brand_id":brand_doc["_id"]}).limit(limit))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def models_list(cls, brand_code, limit=20, cursor=None, fields=None, include_counts=False):
+        brand_id=resolver.resolve(brand_code)[-1]
+        required=("model_code", "product_count") if include_counts else ("model_code",)
+        docs, next_cursor=keyset_page(models_collection, {"brand_id": brand_id}, "model_code", limit, cursor, projection=projection_for(fields, *required))
+        models=[serialize_model(doc, fields) for doc in docs]
+        return (attach_counts(models, docs) if include_counts else models), next_cursor
 
     @classmethod
     def model_insert(cls, brand_code, model_name, model_code, image_file_path):
         cls.validate_fields(model_name, model_code, "placeholder")
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        if models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code}):
+        brand_id=resolver.resolve(brand_code)[-1]
+        if models_collection.find_one({"brand_id": brand_id, "model_code": model_code}):
             raise ValueError("model_code already exists for this brand")
         image_url=upload_image(image_file_path, folder="models")
         model_doc={
-            "brand_id": brand_doc["_id"],
+            "brand_id": brand_id,
             "model_name": model_name,
             "model_code": model_code,
             "image_url": image_url,
@@ -241,67 +255,55 @@ class Model:
 
     @classmethod
     def model_delete(cls, brand_code, model_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        
-        model_id=model_doc["_id"]
+        model_id=resolver.resolve(brand_code, model_code)[-1]
         category_docs=list(categories_collection.find({"model_id": model_id}, {"_id": 1}))
         category_ids=[d["_id"] for d in category_docs]
+        product_filter={"$or": [
+            {"category_id": {"$in": category_ids}},
+            {"brand_code": brand_code, "model_code": model_code}
+        ]}
         try:
             client=settings.MONGO_DB.client
             with client.start_session() as session:
                 with session.start_transaction():
+                    products_collection.delete_many(product_filter, session=session)
                     if category_ids:
-                        products_collection.delete_many({"category_id": {"$in": category_ids}}, session=session)
                         categories_collection.delete_many({"_id": {"$in": category_ids}}, session=session)
                     models_collection.delete_one({"_id": model_id}, session=session)
+            resolver.invalidate(model_id)
             return True
         except Exception:
             try:
+                products_collection.delete_many(product_filter)
                 if category_ids:
-                    products_collection.delete_many({"category_id": {"$in": category_ids}})
                     categories_collection.delete_many({"_id": {"$in": category_ids}})
                 models_collection.delete_one({"_id": model_id})
+                resolver.invalidate(model_id)
                 return True
             except PyMongoError as e:
                 raise RuntimeError(f"database error during cascade delete: {e}") from e
 
     @classmethod
-    def model_fetch(cls, brand_code, model_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
+    def model_fetch(cls, brand_code, model_code, fields=None):
+        brand_id=resolver.resolve(brand_code)[-1]
+        doc=models_collection.find_one({"brand_id": brand_id, "model_code": model_code}, projection_for(fields))
         if not doc:
             raise ValueError("model not found")
-        return cls.from_dict(doc).to_dict()
+        return serialize_model(doc, fields)
 
     @classmethod
-    def model_search(cls, brand_code, query):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        regex={"$regex": query, "$options": "i"}
-        docs=list(models_collection.find(
-            {"brand_id": brand_doc["_id"], "$or": [
-                {"model_name": regex},
-                {"model_code": regex}
-            ]}
-        ))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def model_search(cls, brand_code, query, limit=20, cursor=None, fields=None):
+        brand_id=resolver.resolve(brand_code)[-1]
+        regex={"$regex": re.escape(query), "$options": "i"}
+        docs, next_cursor=keyset_page(models_collection, {"brand_id": brand_id, "$or": [
+            {"model_name": regex},
+            {"model_code": regex}
+        ]}, "model_code", limit, cursor, projection=projection_for(fields, "model_code"))
+        return [serialize_model(doc, fields) for doc in docs], next_cursor
 
     @classmethod
     def model_update(cls, brand_code, model_code, updates: dict, image_file_path=None):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
+        model_id=resolver.resolve(brand_code, model_code)[-1]
         allowed_fields=["model_name", "image_url"]
         update_data={}
         for field in allowed_fields:
@@ -313,14 +315,17 @@ class Model:
             update_data["image_url"]=upload_image(image_file_path, folder="models")
         if not update_data:
             raise ValueError("no valid fields to update")
-        result=models_collection.update_one({"_id": model_doc["_id"]}, {"$set": update_data})
+        result=models_collection.update_one({"_id": model_id}, {"$set": update_data})
         if result.modified_count==0:
             raise RuntimeError("update failed")
-        updated_doc=models_collection.find_one({"_id": model_doc["_id"]})
+        updated_doc=models_collection.find_one({"_id": model_id})
         return cls.from_dict(updated_doc)
 
 
 class Category:
+    __slots__=("id", "model_id", "category_name", "category_code", "image_url", "created_at")
+    public_fields=("_id", "model_id", "category_name", "category_code", "image_url", "created_at")
+
     def __init__(self, model_id, category_name, category_code, image_url, created_at=None, _id=None):
         self.id=_id
         self.model_id=model_id
@@ -349,8 +354,8 @@ class Category:
         if not image_url or not isinstance(image_url, str):
             raise ValueError("invalid image_url: must be a non-empty string")
 
-    def to_dict(self):
-        return {
+    def to_dict(self, fields=None):
+        data={
             "_id": str(self.id) if self.id else None,
             "model_id": str(self.model_id),
             "category_name": self.category_name,
@@ -358,6 +363,7 @@ class Category:
             "image_url": self.image_url,
             "created_at": str(self.created_at),
         }
+        return select_fields(data, fields)
 
     @classmethod
     def from_dict(cls, data):
@@ -371,30 +377,22 @@ class Category:
         )
 
     @classmethod
-    def categories_list(cls, brand_code, model_code, limit=20):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        docs=list(categories_collection.find({"model_id": model_doc["_id"]}).limit(limit))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def categories_list(cls, brand_code, model_code, limit=20, cursor=None, fields=None, include_counts=False):
+        model_id=resolver.resolve(brand_code, model_code)[-1]
+        required=("category_code", "product_count") if include_counts else ("category_code",)
+        docs, next_cursor=keyset_page(categories_collection, {"model_id": model_id}, "category_code", limit, cursor, projection=projection_for(fields, *required))
+        categories=[serialize_category(doc, fields) for doc in docs]
+        return (attach_counts(categories, docs) if include_counts else categories), next_cursor
 
     @classmethod
     def category_insert(cls, brand_code, model_code, category_name, category_code, image_file_path):
         cls.validate_fields(category_name, category_code, "placeholder")
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        if categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code}):
+        model_id=resolver.resolve(brand_code, model_code)[-1]
+        if categories_collection.find_one({"model_id": model_id, "category_code": category_code}):
             raise ValueError("category_code already exists for this model")
         image_url=upload_image(image_file_path, folder="categories")
         category_doc={
-            "model_id": model_doc["_id"],
+            "model_id": model_id,
             "category_name": category_name,
             "category_code": category_code,
             "image_url": image_url,
@@ -406,72 +404,49 @@ class Category:
 
     @classmethod
     def category_delete(cls, brand_code, model_code, category_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        category_id=category_doc["_id"]
+        category_id=resolver.resolve(brand_code, model_code, category_code)[-1]
+        product_filter={"$or": [
+            {"category_id": category_id},
+            {"brand_code": brand_code, "model_code": model_code, "category_code": category_code}
+        ]}
         try:
             client=settings.MONGO_DB.client
             with client.start_session() as session:
                 with session.start_transaction():
-                    products_collection.delete_many({"category_id": category_id}, session=session)
+                    products_collection.delete_many(product_filter, session=session)
                     categories_collection.delete_one({"_id": category_id}, session=session)
+            resolver.invalidate(category_id)
             return True
         except Exception:
             try:
-                products_collection.delete_many({"category_id": category_id})
+                products_collection.delete_many(product_filter)
                 categories_collection.delete_one({"_id": category_id})
+                resolver.invalidate(category_id)
                 return True
             except PyMongoError as e:
                 raise RuntimeError(f"database error during cascade delete: {e}") from e
 
     @classmethod
-    def category_fetch(cls, brand_code, model_code, category_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
+    def category_fetch(cls, brand_code, model_code, category_code, fields=None):
+        model_id=resolver.resolve(brand_code, model_code)[-1]
+        doc=categories_collection.find_one({"model_id": model_id, "category_code": category_code}, projection_for(fields))
         if not doc:
             raise ValueError("category not found")
-        return cls.from_dict(doc).to_dict()
+        return serialize_category(doc, fields)
     
     @classmethod
-    def category_search(cls, brand_code, model_code, query):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        regex={"$regex": query, "$options": "i"}
-        docs=list(categories_collection.find(
-            {"model_id": model_doc["_id"], "$or": [
-                {"category_name": regex},
-                {"category_code": regex}
-            ]}
-        ))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def category_search(cls, brand_code, model_code, query, limit=20, cursor=None, fields=None):
+        model_id=resolver.resolve(brand_code, model_code)[-1]
+        regex={"$regex": re.escape(query), "$options": "i"}
+        docs, next_cursor=keyset_page(categories_collection, {"model_id": model_id, "$or": [
+            {"category_name": regex},
+            {"category_code": regex}
+        ]}, "category_code", limit, cursor, projection=projection_for(fields, "category_code"))
+        return [serialize_category(doc, fields) for doc in docs], next_cursor
 
     @classmethod
     def category_update(cls, brand_code, model_code, category_code, updates:dict, image_file_path=None):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
+        category_id=resolver.resolve(brand_code, model_code, category_code)[-1]
         allowed_fields=["category_name", "image_url"]
         update_data={}
         for field in allowed_fields:
@@ -484,24 +459,48 @@ class Category:
             update_data["image_url"]=upload_image(image_file_path, folder="categories")
         if not update_data:
             raise ValueError("no valid fields to update")
-        result=categories_collection.update_one({"_id": category_doc["_id"]}, {"$set": update_data})
+        result=categories_collection.update_one({"_id": category_id}, {"$set": update_data})
         if result.modified_count==0:
             raise RuntimeError("update failed")
-        updated_doc=categories_collection.find_one({"_id": category_doc["_id"]})
+        updated_doc=categories_collection.find_one({"_id": category_id})
         return cls.from_dict(updated_doc)
 
 
 class Product:
+    __slots__=(
+        "id", "category_id", "brand_code", "model_code", "category_code", "product_name", "product_code",
+        "code", "description", "price", "effective_price", "stock", "image_url", "created_at", "reviews", "offers"
+    )
+    public_fields=(
+        "_id", "category_id", "brand_code", "model_code", "category_code", "product_name", "product_code",
+        "code", "description", "price", "effective_price", "stock", "image_url", "created_at", "reviews", "offers"
+    )
+    batch_limit=100
+    sort_options={
+        "code": ("product_code", 1),
+        "price": ("effective_price", 1),
+        "-price": ("effective_price", -1),
+        "name": ("product_name", 1),
+        "-name": ("product_name", -1),
+        "created_at": ("created_at", 1),
+        "newest": ("created_at", -1),
+    }
+
     def __init__(self, category_id, product_name, product_code, code, 
                  description, price, stock, image_url, 
-                 created_at=None, reviews=None, offers=None, _id=None):
+                 created_at=None, reviews=None, offers=None, _id=None,
+                 brand_code=None, model_code=None, category_code=None, effective_price=None):
         self.id=_id
         self.category_id=category_id
+        self.brand_code=brand_code
+        self.model_code=model_code
+        self.category_code=category_code
         self.product_name=product_name
         self.product_code=product_code
         self.code=code
         self.description=description
         self.price=price
+        self.effective_price=price if effective_price is None else effective_price
         self.stock=stock
         self.image_url=image_url
         self.created_at=created_at or datetime.now(timezone.utc)
@@ -523,21 +522,26 @@ class Product:
         if not isinstance(image_url, str) or len(image_url.strip())==0:
             raise ValueError("invalid image_url")
 
-    def to_dict(self):
-        return {
+    def to_dict(self, fields=None):
+        data={
             "_id": str(self.id) if self.id else None,
             "category_id": str(self.category_id),
+            "brand_code": self.brand_code,
+            "model_code": self.model_code,
+            "category_code": self.category_code,
             "product_name": self.product_name,
             "product_code": self.product_code,
             "code": self.code,
             "description": self.description,
             "price": self.price,
+            "effective_price": self.effective_price,
             "stock": self.stock,
             "image_url": self.image_url,
             "created_at": str(self.created_at),
             "reviews": self.reviews,
             "offers": self.offers,
         }
+        return select_fields(data, fields)
 
     @classmethod
     def from_dict(cls, data):
@@ -554,21 +558,53 @@ class Product:
             reviews=data.get("reviews", []),
             offers=data.get("offers", {}),
             _id=data.get("_id"),
+            brand_code=data.get("brand_code"),
+            model_code=data.get("model_code"),
+            category_code=data.get("category_code"),
+            effective_price=data.get("effective_price"),
         )
 
+    @staticmethod
+    def path_filter(brand_code, model_code, category_code, product_code=None):
+        query={"brand_code": brand_code, "model_code": model_code, "category_code": category_code}
+        if product_code is not None:
+            query["product_code"]=product_code
+        return query
+
     @classmethod
-    def products_list(cls, brand_code, model_code, category_code, limit=20):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        docs=list(products_collection.find({"category_id": category_doc["_id"]}).limit(limit))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def list_filters(cls, min_price=None, max_price=None, in_stock=False, on_offer=False):
+        query={}
+        price={}
+        for op, value in (("$gte", min_price), ("$lte", max_price)):
+            if value is None:
+                continue
+            try:
+                price[op]=float(value)
+            except (ValueError, TypeError):
+                raise ValueError("min_price and max_price must be numbers")
+            if price[op]<0:
+                raise ValueError("min_price and max_price must not be negative")
+        if price:
+            query["effective_price"]=price
+        if in_stock:
+            query["stock"]={"$gt": 0}
+            query["$expr"]={"$gt": ["$stock", {"$ifNull": ["$reserved", 0]}]}
+        if on_offer:
+            now=int(datetime.now(timezone.utc).timestamp())
+            query["offers.validity.from"]={"$lte": now}
+            query["offers.validity.to"]={"$gte": now}
+        return query
+
+    @classmethod
+    def products_list(cls, brand_code, model_code, category_code, limit=20, cursor=None, fields=None, filters=None, sort="code"):
+        if sort not in cls.sort_options:
+            raise ValueError(f"sort must be one of: {', '.join(cls.sort_options)}")
+        sort_field, direction=cls.sort_options[sort]
+        query={**cls.path_filter(brand_code, model_code, category_code), **(filters or {})}
+        docs, next_cursor=keyset_page(products_collection, query, sort_field, limit, cursor, direction=direction, projection=projection_for(fields, sort_field))
+        if not docs and cursor is None:
+            resolver.resolve(brand_code, model_code, category_code)
+        return [serialize_product(doc, fields) for doc in docs], next_cursor
 
     @classmethod
     def product_insert(cls,brand_code, model_code, category_code, product_name, product_code, description, price, stock, image_file):
@@ -577,25 +613,21 @@ class Product:
             raise ValueError("image upload failed")
         image_url=uploaded_url
         cls.validate_fields(product_name, product_code, description, price, stock, image_url)
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        if products_collection.find_one({"category_id": category_doc["_id"], "product_code": product_code}):
+        category_id=resolver.resolve(brand_code, model_code, category_code)[-1]
+        if products_collection.find_one({"category_id": category_id, "product_code": product_code}):
             raise ValueError("product_code already exists for this category")
-        code=f"{brand_doc['brand_code']}-{model_doc['model_code']}-{category_doc['category_code']}-{product_code}"
+        code=f"{brand_code}-{model_code}-{category_code}-{product_code}"
         product_doc={
-            "category_id": category_doc["_id"],
+            "category_id": category_id,
+            "brand_code": brand_code,
+            "model_code": model_code,
+            "category_code": category_code,
             "product_name": product_name,
             "product_code": product_code,
             "code": code,
             "description": description,
             "price": price,
+            "effective_price": price,
             "stock": stock,
             "image_url": image_url,
             "created_at": datetime.now(timezone.utc),
@@ -607,76 +639,155 @@ class Product:
         return cls.from_dict(product_doc)
 
     @classmethod
-    def product_delete(cls, brand_code, model_code, category_code, product_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
+    def product_lookup(cls, brand_code, model_code, category_code, product_code, projection=None):
+        doc=products_collection.find_one(cls.path_filter(brand_code, model_code, category_code, product_code), projection)
+        if doc:
+            return doc
+        ids=resolver.peek(brand_code, model_code, category_code)
+        if ids:
+            doc=products_collection.find_one({"category_id": ids[-1], "product_code": product_code}, projection)
+            if not doc:
+                raise ValueError("product not found")
+            return doc
+        pipeline=[
+            {"$match": {"brand_code": brand_code}},
+            {"$project": {"_id": 1}},
+            {"$lookup": {
+                "from": models_collection.name,
+                "let": {"brand_id": "$_id"},
+                "pipeline": [
+                    {"$match": {"model_code": model_code, "$expr": {"$eq": ["$brand_id", "$$brand_id"]}}},
+                    {"$project": {"_id": 1}},
+                    {"$lookup": {
+                        "from": categories_collection.name,
+                        "let": {"model_id": "$_id"},
+                        "pipeline": [
+                            {"$match": {"category_code": category_code, "$expr": {"$eq": ["$model_id", "$$model_id"]}}},
+                            {"$project": {"_id": 1}},
+                            {"$lookup": {
+                                "from": products_collection.name,
+                                "let": {"category_id": "$_id"},
+                                "pipeline": [
+                                    {"$match": {"product_code": product_code, "$expr": {"$eq": ["$category_id", "$$category_id"]}}}
+                                ]+([{"$project": projection}] if projection else []),
+                                "as": "products"
+                            }}
+                        ],
+                        "as": "categories"
+                    }}
+                ],
+                "as": "models"
+            }}
+        ]
+        try:
+            docs=list(brands_collection.aggregate(pipeline))
+        except PyMongoError as e:
+            raise RuntimeError(f"database error: {e}")
+        if not docs:
             raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
+        brand_doc=docs[0]
+        if not brand_doc["models"]:
             raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
+        model_doc=brand_doc["models"][0]
+        if not model_doc["categories"]:
             raise ValueError("category not found")
-        result=products_collection.delete_one({"category_id": category_doc["_id"], "product_code": product_code})
+        category_doc=model_doc["categories"][0]
+        resolver.prime((brand_code, model_code, category_code), (brand_doc["_id"], model_doc["_id"], category_doc["_id"]))
+        if not category_doc["products"]:
+            raise ValueError("product not found")
+        return category_doc["products"][0]
+
+    @classmethod
+    def product_delete(cls, brand_code, model_code, category_code, product_code):
+        result=products_collection.delete_one(cls.path_filter(brand_code, model_code, category_code, product_code))
+        if result.deleted_count:
+            return True
+        ids=resolver.peek(brand_code, model_code, category_code)
+        if ids:
+            result=products_collection.delete_one({"category_id": ids[-1], "product_code": product_code})
+        else:
+            product_doc=cls.product_lookup(brand_code, model_code, category_code, product_code)
+            result=products_collection.delete_one({"_id": product_doc["_id"]})
         if result.deleted_count==0:
             raise ValueError("product not found")
         return True
 
     @classmethod
-    def product_fetch(cls, brand_code, model_code, category_code, product_code):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        doc=products_collection.find_one({"category_id": category_doc["_id"], "product_code": product_code})
-        if not doc:
-            raise ValueError("product not found")
-        return cls.from_dict(doc).to_dict()
+    def product_fetch(cls, brand_code, model_code, category_code, product_code, fields=None):
+        doc=cls.product_lookup(brand_code, model_code, category_code, product_code, projection_for(fields))
+        return serialize_product(doc, fields)
 
     @classmethod
-    def product_search(cls, brand_code, model_code, category_code, query):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        regex={"$regex": query, "$options": "i"}
-        docs=list(products_collection.find(
-            {"category_id": category_doc["_id"], "$or": [
-                {"product_name": regex},
-                {"product_code": regex},
-                {"description": regex}
-            ]}
-        ))
-        return [cls.from_dict(doc).to_dict() for doc in docs]
+    def products_batch(cls, ids=None, codes=None, fields=None):
+        ids=ids or []
+        codes=codes or []
+        if not isinstance(ids, list) or not isinstance(codes, list):
+            raise ValueError("ids and codes must be lists")
+        if not ids and not codes:
+            raise ValueError("ids or codes required")
+        if len(ids)+len(codes)>cls.batch_limit:
+            raise ValueError(f"at most {cls.batch_limit} products per batch")
+        invalid=[str(product_id) for product_id in ids if not ObjectId.is_valid(product_id)]
+        if invalid:
+            raise ValueError(f"invalid product id: {', '.join(invalid)}")
+        object_ids=[ObjectId(product_id) for product_id in ids]
+        codes=[str(code) for code in codes]
+        clauses=[]
+        if object_ids:
+            clauses.append({"_id": {"$in": object_ids}})
+        if codes:
+            clauses.append({"code": {"$in": codes}})
+        query=clauses[0] if len(clauses)==1 else {"$or": clauses}
+        try:
+            docs=list(products_collection.find(query, projection_for(fields, "code")))
+        except PyMongoError as e:
+            raise RuntimeError(f"database error during batch lookup: {e}")
+        by_id={doc["_id"]: doc for doc in docs}
+        by_code={doc.get("code"): doc for doc in docs}
+        products=[]
+        missing=[]
+        requested=[(str(product_id), by_id.get(product_id)) for product_id in object_ids]
+        requested+=[(code, by_code.get(code)) for code in codes]
+        for key, doc in requested:
+            if doc:
+                products.append(serialize_product(doc, fields))
+            else:
+                missing.append(key)
+        return products, missing
+
+    @classmethod
+    def product_search(cls, brand_code, model_code, category_code, query, limit=20, cursor=None, fields=None, mode="regex"):
+        if mode not in ("text", "regex"):
+            raise ValueError("mode must be 'text' or 'regex'")
+        path=cls.path_filter(brand_code, model_code, category_code)
+        if mode=="text":
+            if cursor is not None:
+                raise ValueError("cursor is not supported with mode=text; results are ranked by relevance")
+            projection=projection_for(fields) or {}
+            projection["score"]={"$meta": "textScore"}
+            try:
+                docs=list(products_collection.find(
+                    {**path, "$text": {"$search": query}}, projection
+                ).sort([("score", {"$meta": "textScore"})]).limit(limit))
+            except PyMongoError as e:
+                raise RuntimeError(f"database error during search: {e}")
+            if not docs:
+                resolver.resolve(brand_code, model_code, category_code)
+            return [serialize_product(doc, fields) for doc in docs], None
+        regex={"$regex": re.escape(query), "$options": "i"}
+        docs, next_cursor=keyset_page(products_collection, {**path, "$or": [
+            {"product_name": regex},
+            {"product_code": regex},
+            {"description": regex}
+        ]}, "product_code", limit, cursor, projection=projection_for(fields, "product_code"))
+        if not docs and cursor is None:
+            resolver.resolve(brand_code, model_code, category_code)
+        return [serialize_product(doc, fields) for doc in docs], next_cursor
 
 
     @classmethod
     def product_update(cls, brand_code, model_code, category_code, product_code, updates:dict, image_file_path=None):
-        brand_doc=brands_collection.find_one({"brand_code": brand_code})
-        if not brand_doc:
-            raise ValueError("brand not found")
-        model_doc=models_collection.find_one({"brand_id": brand_doc["_id"], "model_code": model_code})
-        if not model_doc:
-            raise ValueError("model not found")
-        category_doc=categories_collection.find_one({"model_id": model_doc["_id"], "category_code": category_code})
-        if not category_doc:
-            raise ValueError("category not found")
-        product_doc=products_collection.find_one({
-            "category_id": category_doc["_id"],
-            "product_code": product_code
-        })
-        if not product_doc:
-            raise ValueError("product not found")
+        product_doc=cls.product_lookup(brand_code, model_code, category_code, product_code)
         allowed_fields=["product_name", "description", "price", "stock", "image_url", "offers"]
         update_data={}
         if image_file_path:
@@ -729,13 +840,23 @@ class Product:
                     update_data[field]=str(updates[field]).strip()
         if not update_data:
             raise ValueError("no valid fields to update")
+        update={"$set": update_data}
+        if "price" in update_data or "offers" in update_data:
+            pricing=pricing_update(
+                update_data.get("price", product_doc.get("price")),
+                update_data.get("offers", product_doc.get("offers")),
+            )
+            update_data.update(pricing["$set"])
+            if "$unset" in pricing:
+                update["$unset"]=pricing["$unset"]
         result=products_collection.update_one(
             {"_id": product_doc["_id"]},
-            {"$set": update_data}
+            update
         )
         if result.modified_count==0:
             raise RuntimeError("update failed")
         updated_doc=products_collection.find_one({"_id": product_doc["_id"]})
+        pricebook.put(updated_doc)
         now=datetime.now(timezone.utc)
         affected_carts=carts_collection.find({"items.product_id": updated_doc["_id"]})
         for cart in affected_carts:
@@ -763,7 +884,7 @@ class Admin:
         try:
             if not query:
                 raise ValueError("query is required")
-            regex={"$regex": query, "$options": "i"}
+            regex={"$regex": re.escape(query), "$options": "i"}
             search_filter={
                 "$or": [
                     {"collection": regex},
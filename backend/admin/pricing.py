@@ -0,0 +1,51 @@
+import time
+from .admin import *
+
+
+def price_state(price, offers, now=None):
+    now=time.time() if now is None else now
+    price=price or 0
+    if not offers:
+        return price, None
+    validity=offers.get("validity", {})
+    from_ts=validity.get("from", 0)
+    to_ts=validity.get("to", 0)
+    if now<from_ts:
+        return price, from_ts
+    if now<=to_ts:
+        return round(price*(1-(offers.get("discount", 0)/100)), 2), to_ts+1
+    return price, None
+
+def pricing_update(price, offers, now=None):
+    effective_price, next_transition=price_state(price, offers, now)
+    if next_transition is None:
+        return {"$set": {"effective_price": effective_price}, "$unset": {"next_price_transition": ""}}
+    return {"$set": {"effective_price": effective_price, "next_price_transition": next_transition}}
+
+def apply_due_transitions(batch_size=500):
+    now=time.time()
+    docs=list(products_collection.find(
+        {"next_price_transition": {"$lte": now}},
+        {"price": 1, "offers": 1, "next_price_transition": 1}
+    ).sort("next_price_transition", 1).limit(batch_size))
+    applied=0
+    for doc in docs:
+        result=products_collection.update_one(
+            {
+                "_id": doc["_id"],
+                "price": doc.get("price"),
+                "offers": doc.get("offers"),
+                "next_price_transition": doc["next_price_transition"],
+            },
+            pricing_update(doc.get("price"), doc.get("offers"), now)
+        )
+        applied+=result.modified_count
+    return applied, len(docs)==batch_size
+
+def next_transition_at():
+    doc=products_collection.find_one(
+        {"next_price_transition": {"$exists": True}},
+        {"next_price_transition": 1},
+        sort=[("next_price_transition", 1)]
+    )
+    return doc["next_price_transition"] if doc else None
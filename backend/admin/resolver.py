@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+from .admin import *
+
+
+class CatalogResolver:
+    levels=[
+        (brands_collection, "brand_code", None, "brand not found"),
+        (models_collection, "model_code", "brand_id", "model not found"),
+        (categories_collection, "category_code", "model_id", "category not found"),
+    ]
+
+    def __init__(self, max_size=4096, ttl=5):
+        self.max_size=max_size
+        self.ttl=ttl
+        self.live=False
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+
+    def peek(self, *codes):
+        with self._lock:
+            entry=self._entries.get(codes)
+            if entry is None:
+                return None
+            ids, expires_at=entry
+            if not self.live and expires_at<time.monotonic():
+                del self._entries[codes]
+                return None
+            self._entries.move_to_end(codes)
+            return ids
+
+    def prime(self, codes, ids):
+        with self._lock:
+            self._entries[tuple(codes)]=(tuple(ids), time.monotonic()+self.ttl)
+            self._entries.move_to_end(tuple(codes))
+            while len(self._entries)>self.max_size:
+                self._entries.popitem(last=False)
+
+    def resolve(self, *codes):
+        ids=self.peek(*codes)
+        if ids is not None:
+            return ids
+        parent_ids=self.resolve(*codes[:-1]) if len(codes)>1 else ()
+        coll, code_field, parent_field, error=self.levels[len(codes)-1]
+        query={code_field: codes[-1]}
+        if parent_field:
+            query[parent_field]=parent_ids[-1]
+        doc=coll.find_one(query, {"_id": 1})
+        if not doc:
+            raise ValueError(error)
+        ids=parent_ids+(doc["_id"],)
+        self.prime(codes, ids)
+        return ids
+
+    def invalidate(self, doc_id):
+        with self._lock:
+            stale=[codes for codes, (ids, _) in self._entries.items() if doc_id in ids]
+            for codes in stale:
+                del self._entries[codes]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+resolver=CatalogResolver(max_size=settings.CATALOG_RESOLVER_SIZE, ttl=settings.CATALOG_RESOLVER_TTL)
@@ -0,0 +1,277 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from django.conf import settings
+from pymongo.errors import PyMongoError
+from .admin import *
+
+
+def trigrams(text):
+    grams=set()
+    for token in text.split():
+        padded=f"  {token} "
+        grams.update(padded[i:i+3] for i in range(len(padded)-2))
+    return grams
+
+def query_trigrams(token):
+    if len(token)<3:
+        padded=f"  {token}"
+        return {padded[i:i+3] for i in range(len(padded)-2)}
+    return {token[i:i+3] for i in range(len(token)-2)}
+
+
+def prefix_terms(entry):
+    terms=set()
+    words=str(entry["name"] or "").lower().split()
+    for i in range(len(words)):
+        terms.add(" ".join(words[i:]))
+    for code in (entry["code"], entry.get("full_code")):
+        if code:
+            terms.add(str(code).lower())
+    return terms
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.keys=defaultdict(list)
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.keys.values())
+
+    def add(self, entry, rank):
+        for term in prefix_terms(entry):
+            insort(self.keys[rank], (term, entry["_id"]))
+
+    def remove(self, entry, rank):
+        keys=self.keys[rank]
+        for term in prefix_terms(entry):
+            key=(term, entry["_id"])
+            i=bisect_left(keys, key)
+            if i<len(keys) and keys[i]==key:
+                del keys[i]
+
+    def load(self, entries, rank):
+        keys=defaultdict(list)
+        for entry in entries:
+            keys[rank[entry["type"]]].extend((term, entry["_id"]) for term in prefix_terms(entry))
+        for bucket in keys.values():
+            bucket.sort()
+        self.keys=keys
+
+    def lookup(self, prefix, limit, ranks=None):
+        matches=[]
+        seen=set()
+        for rank in sorted(self.keys):
+            if ranks is not None and rank not in ranks:
+                continue
+            keys=self.keys[rank]
+            i=bisect_left(keys, (prefix,))
+            while i<len(keys) and len(matches)<limit:
+                term, doc_id=keys[i]
+                if not term.startswith(prefix):
+                    break
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    matches.append(doc_id)
+                i+=1
+            if len(matches)>=limit:
+                break
+        return matches
+
+
+class CatalogIndex:
+    kinds={
+        brands_collection.name: ("brand", "brand_name", "brand_code", None),
+        models_collection.name: ("model", "model_name", "model_code", "brand_id"),
+        categories_collection.name: ("category", "category_name", "category_code", "model_id"),
+        products_collection.name: ("product", "product_name", "product_code", "category_id"),
+    }
+    rank={"brand": 0, "model": 1, "category": 2, "product": 3}
+
+    def __init__(self, ttl=300):
+        self.ttl=ttl
+        self.entries={}
+        self.postings=defaultdict(set)
+        self.prefixes=PrefixIndex()
+        self.built=False
+        self.live=False
+        self.expires_at=0
+        self._lock=threading.RLock()
+        self._build_lock=threading.Lock()
+
+    def _text(self, entry):
+        parts=[entry["name"], entry["code"], entry.get("full_code")]
+        return " ".join(str(part).lower() for part in parts if part)
+
+    def _entry(self, coll_name, doc):
+        kind, name_field, code_field, parent_field=self.kinds[coll_name]
+        return {
+            "type": kind,
+            "_id": doc["_id"],
+            "name": doc.get(name_field),
+            "code": doc.get(code_field),
+            "full_code": doc.get("code"),
+            "parent_id": doc.get(parent_field) if parent_field else None,
+        }
+
+    def _add(self, entry):
+        self.entries[entry["_id"]]=entry
+        for gram in trigrams(self._text(entry)):
+            self.postings[gram].add(entry["_id"])
+        self.prefixes.add(entry, self.rank[entry["type"]])
+
+    def _remove(self, doc_id):
+        entry=self.entries.pop(doc_id, None)
+        if not entry:
+            return None
+        for gram in trigrams(self._text(entry)):
+            posting=self.postings.get(gram)
+            if posting:
+                posting.discard(doc_id)
+                if not posting:
+                    del self.postings[gram]
+        self.prefixes.remove(entry, self.rank[entry["type"]])
+        return entry
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def rebuild(self):
+        if not self._build_lock.acquire(blocking=False):
+            return
+        try:
+            self._build()
+        except PyMongoError as e:
+            logger.error(f"[CATALOG INDEX ERROR] background rebuild failed: {e}")
+        finally:
+            self._build_lock.release()
+
+    def _build(self):
+        entries=[]
+        for coll in (brands_collection, models_collection, categories_collection, products_collection):
+            _, name_field, code_field, parent_field=self.kinds[coll.name]
+            projection={name_field: 1, code_field: 1}
+            if parent_field:
+                projection[parent_field]=1
+            if coll==products_collection:
+                projection["code"]=1
+            entries.extend(self._entry(coll.name, doc) for doc in coll.find({}, projection))
+        self.load(entries)
+        logger.info(f"[CATALOG INDEX] built with {len(entries)} entries and {len(self.postings)} trigrams")
+
+    def load(self, entries):
+        postings=defaultdict(set)
+        for entry in entries:
+            for gram in trigrams(self._text(entry)):
+                postings[gram].add(entry["_id"])
+        prefixes=PrefixIndex()
+        prefixes.load(entries, self.rank)
+        with self._lock:
+            self.entries={entry["_id"]: entry for entry in entries}
+            self.postings=postings
+            self.prefixes=prefixes
+            self.built=True
+            self.expires_at=time.monotonic()+self.ttl
+
+    def ensure_built(self):
+        if self.built and (self.live or self.expires_at>time.monotonic()):
+            return
+        if not self._build_lock.locked():
+            threading.Thread(target=self.rebuild, daemon=True).start()
+        if not self.built:
+            raise RuntimeError("catalog index is still loading, please retry shortly")
+
+    def apply_change(self, change):
+        coll_name=change["ns"]["coll"]
+        if coll_name not in self.kinds:
+            return
+        doc_id=change["documentKey"]["_id"]
+        with self._lock:
+            self._remove(doc_id)
+            doc=change.get("fullDocument")
+            if change["operationType"]!="delete" and doc:
+                self._add(self._entry(coll_name, doc))
+
+    def path(self, doc_id):
+        with self._lock:
+            chain=[]
+            entry=self.entries.get(doc_id)
+            while entry:
+                chain.append(entry)
+                entry=self.entries.get(entry["parent_id"]) if entry["parent_id"] else None
+        if not chain or chain[-1]["type"]!="brand":
+            return None
+        return {f"{entry['type']}_code": entry["code"] for entry in reversed(chain)}
+
+    def ancestors(self, doc_id):
+        with self._lock:
+            entry=self.entries.get(doc_id)
+            chain=[]
+            while entry and entry["parent_id"]:
+                entry=self.entries.get(entry["parent_id"])
+                if entry:
+                    chain.append(entry["_id"])
+            if not entry or entry["type"]!="brand":
+                return None
+        return chain
+
+    def hit(self, entry):
+        return {
+            "type": entry["type"],
+            "_id": str(entry["_id"]),
+            "name": entry["name"],
+            "code": entry["code"],
+            "path": self.path(entry["_id"]),
+        }
+
+    def search(self, query, limit=20):
+        self.ensure_built()
+        query=" ".join(str(query).lower().split())
+        if len(query)<2:
+            return []
+        tokens=query.split()
+        grams=set().union(*(query_trigrams(token) for token in tokens))
+        with self._lock:
+            postings=sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+            if not postings or not postings[0]:
+                return []
+            matches=set(postings[0]).intersection(*postings[1:])
+            entries=[self.entries[doc_id] for doc_id in matches]
+        entries=[entry for entry in entries if all(token in self._text(entry) for token in tokens)]
+        ranked=heapq.nsmallest(limit*2, entries, key=lambda e: (
+            str(e["name"]).lower()!=query,
+            not str(e["name"]).lower().startswith(query),
+            self.rank[e["type"]],
+            len(str(e["name"])),
+        ))
+        hits=[]
+        for entry in ranked:
+            hit=self.hit(entry)
+            if hit["path"]:
+                hits.append(hit)
+            if len(hits)>=limit:
+                break
+        return hits
+
+    def autocomplete(self, prefix, limit=10, types=None):
+        self.ensure_built()
+        prefix=" ".join(str(prefix).lower().split())
+        if not prefix:
+            return []
+        ranks={self.rank[kind] for kind in types} if types else None
+        with self._lock:
+            entries=[self.entries[doc_id] for doc_id in self.prefixes.lookup(prefix, limit*2, ranks=ranks)]
+        hits=[]
+        for entry in entries:
+            hit=self.hit(entry)
+            if hit["path"]:
+                hits.append(hit)
+            if len(hits)>=limit:
+                break
+        return hits
+
+
+catalog_index=CatalogIndex(ttl=settings.CATALOG_INDEX_TTL)
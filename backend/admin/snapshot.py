@@ -0,0 +1,169 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from .admin import *
+from .versions import catalog_versions
+
+
+def dumps(data):
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+
+class CatalogSnapshot:
+    def __init__(self, ttl=30):
+        self.ttl=ttl
+        self.fragments={False: {}, True: {}}
+        self.summaries={}
+        self.dirty={False: set(), True: set()}
+        self.blobs={}
+        self.built={False: False, True: False}
+        self.generation=0
+        self._lock=threading.Lock()
+        self._render_lock=threading.Lock()
+
+    def invalidate(self, path, products_only=False):
+        with self._lock:
+            self.generation+=1
+            for products in (True,) if products_only else (False, True):
+                self.dirty[products].add(path[0])
+                self.blobs.pop(products, None)
+            prefix=path[:3]
+            for key in [key for key in self.summaries if key[:len(prefix)]==prefix]:
+                del self.summaries[key]
+
+    def reset(self):
+        with self._lock:
+            self.generation+=1
+            for products in (False, True):
+                self.fragments[products]={}
+                self.dirty[products].clear()
+                self.built[products]=False
+            self.summaries.clear()
+            self.blobs.clear()
+
+    def product_summaries(self, categories, generation):
+        with self._lock:
+            cached={key: self.summaries[key] for key in categories if key in self.summaries}
+        missing={category_id: key for key, category_id in categories.items() if key not in cached}
+        if not missing:
+            return cached
+        fetched={key: [] for key in missing.values()}
+        for doc in products_collection.find(
+            {"category_id": {"$in": list(missing)}},
+            {"category_id": 1, "product_name": 1, "product_code": 1, "price": 1, "effective_price": 1, "stock": 1, "image_url": 1}
+        ).sort("product_code", 1):
+            fetched[missing[doc["category_id"]]].append({
+                "_id": str(doc["_id"]),
+                "product_name": doc.get("product_name"),
+                "product_code": doc.get("product_code"),
+                "price": doc.get("price"),
+                "effective_price": doc.get("effective_price", doc.get("price")),
+                "stock": doc.get("stock"),
+                "image_url": doc.get("image_url"),
+            })
+        with self._lock:
+            if generation==self.generation:
+                self.summaries.update(fetched)
+        return {**cached, **fetched}
+
+    def render_brand(self, brand, products=False, generation=None):
+        models=list(models_collection.find(
+            {"brand_id": brand["_id"]},
+            {"model_name": 1, "model_code": 1, "image_url": 1}
+        ).sort("model_code", 1))
+        categories={}
+        for doc in categories_collection.find(
+            {"model_id": {"$in": [model["_id"] for model in models]}},
+            {"model_id": 1, "category_name": 1, "category_code": 1, "image_url": 1}
+        ).sort("category_code", 1):
+            categories.setdefault(doc["model_id"], []).append(doc)
+        summaries={}
+        if products:
+            summaries=self.product_summaries({
+                (brand["brand_code"], model["model_code"], category["category_code"]): category["_id"]
+                for model in models for category in categories.get(model["_id"], [])
+            }, generation)
+        data={
+            "_id": str(brand["_id"]),
+            "brand_name": brand.get("brand_name"),
+            "brand_code": brand.get("brand_code"),
+            "image_url": brand.get("image_url"),
+            "models": [],
+        }
+        for model in models:
+            model_data={
+                "_id": str(model["_id"]),
+                "model_name": model.get("model_name"),
+                "model_code": model.get("model_code"),
+                "image_url": model.get("image_url"),
+                "categories": [],
+            }
+            for category in categories.get(model["_id"], []):
+                category_data={
+                    "_id": str(category["_id"]),
+                    "category_name": category.get("category_name"),
+                    "category_code": category.get("category_code"),
+                    "image_url": category.get("image_url"),
+                }
+                if products:
+                    category_data["products"]=summaries.get((brand["brand_code"], model["model_code"], category["category_code"]), [])
+                model_data["categories"].append(category_data)
+            data["models"].append(model_data)
+        return dumps(data)
+
+    def refresh(self, products, full):
+        with self._lock:
+            generation=self.generation
+            dirty=set(self.dirty[products])
+            self.dirty[products].clear()
+        projection={"brand_name": 1, "brand_code": 1, "image_url": 1}
+        query={} if full else {"brand_code": {"$in": list(dirty)}}
+        rendered={brand["brand_code"]: self.render_brand(brand, products, generation) for brand in brands_collection.find(query, projection)}
+        with self._lock:
+            if full:
+                if generation==self.generation:
+                    self.fragments[products]=rendered
+                    self.built[products]=True
+                return rendered, generation, len(rendered)
+            fragments=dict(self.fragments[products])
+            for brand_code in dirty:
+                fragments.pop(brand_code, None)
+            fragments.update(rendered)
+            self.fragments[products]=fragments
+            return fragments, generation, len(rendered)
+
+    def assemble(self, fragments):
+        raw=b'{"brands":['+b",".join(fragments[code] for code in sorted(fragments))+b"]}"
+        etag=f'"{hashlib.sha1(raw).hexdigest()}"'
+        return raw, gzip.compress(raw, compresslevel=6), etag
+
+    def cached(self, products, live):
+        with self._lock:
+            blob=self.blobs.get(products)
+            if blob and (live or blob[3]>time.monotonic()):
+                return blob[:3]
+        return None
+
+    def get(self, products=False):
+        live=catalog_versions.live
+        blob=self.cached(products, live)
+        if blob:
+            return blob
+        with self._render_lock:
+            blob=self.cached(products, live)
+            if blob:
+                return blob
+            if not live:
+                self.reset()
+            fragments, generation, rendered=self.refresh(products, full=not self.built[products])
+            raw, compressed, etag=self.assemble(fragments)
+            with self._lock:
+                if generation==self.generation:
+                    self.blobs[products]=(raw, compressed, etag, time.monotonic()+self.ttl)
+        logger.info(f"[SNAPSHOT] rendered {rendered} brand fragments, {len(compressed)} bytes gzipped (products={products})")
+        return raw, compressed, etag
+
+
+catalog_snapshot=CatalogSnapshot()
@@ -1,3 +1,483 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
+from bson import ObjectId
+from django.test import SimpleTestCase
+from pymongo.errors import AutoReconnect, OperationFailure
+from .admin import brands_collection, products_collection
+from . import events
+from .checkpoints import clear_checkpoint, is_history_lost, load_checkpoint, save_checkpoint
+from .models import Product
+from .pricing import apply_due_transitions, price_state, pricing_update
+from .resolver import CatalogResolver
+from .snapshot import CatalogSnapshot
+from .search import CatalogIndex, query_trigrams, trigrams
+from .versions import CatalogVersions
 
-# Create your tests here.
+
+class CatalogResolverTests(SimpleTestCase):
+    def setUp(self):
+        self.brands=mock.MagicMock()
+        self.brand_id=ObjectId()
+        self.brands.find_one.return_value={"_id": self.brand_id}
+        self.resolver=CatalogResolver(max_size=2, ttl=5)
+        self.resolver.levels=[(self.brands, "brand_code", None, "brand not found")]
+
+    def test_resolve_caches_ids(self):
+        self.assertEqual(self.resolver.resolve("bmw"), (self.brand_id,))
+        self.assertEqual(self.resolver.resolve("bmw"), (self.brand_id,))
+        self.assertEqual(self.brands.find_one.call_count, 1)
+
+    def test_missing_code_raises_value_error(self):
+        self.brands.find_one.return_value=None
+        with self.assertRaisesMessage(ValueError, "brand not found"):
+            self.resolver.resolve("bmw")
+
+    def test_entries_expire_when_not_live(self):
+        with mock.patch("admin.resolver.time.monotonic", return_value=100):
+            self.resolver.resolve("bmw")
+        with mock.patch("admin.resolver.time.monotonic", return_value=106):
+            self.assertIsNone(self.resolver.peek("bmw"))
+
+    def test_entries_do_not_expire_when_live(self):
+        self.resolver.live=True
+        with mock.patch("admin.resolver.time.monotonic", return_value=100):
+            self.resolver.resolve("bmw")
+        with mock.patch("admin.resolver.time.monotonic", return_value=106):
+            self.assertEqual(self.resolver.peek("bmw"), (self.brand_id,))
+
+    def test_invalidate_drops_paths_through_id(self):
+        self.resolver.resolve("bmw")
+        self.assertEqual(self.resolver.invalidate(self.brand_id), 1)
+        self.assertIsNone(self.resolver.peek("bmw"))
+
+    def test_lru_bound(self):
+        for code in ("a", "b", "c"):
+            self.resolver.prime((code,), (ObjectId(),))
+        self.assertIsNone(self.resolver.peek("a"))
+        self.assertIsNotNone(self.resolver.peek("c"))
+
+
+class ProductListTests(SimpleTestCase):
+    def test_list_queries_on_hierarchy_codes(self):
+        doc={"_id": ObjectId(), "category_id": ObjectId(), "product_code": "P1"}
+        with mock.patch("admin.models.keyset_page", return_value=([doc], None)) as page, \
+                mock.patch("admin.models.resolver") as resolver:
+            products, _=Product.products_list("BMW", "X5", "BRK", filters={"stock": {"$gt": 0}})
+        query=page.call_args[0][1]
+        self.assertEqual(query, {"brand_code": "BMW", "model_code": "X5", "category_code": "BRK", "stock": {"$gt": 0}})
+        self.assertEqual(products[0]["product_code"], "P1")
+        resolver.resolve.assert_not_called()
+
+    def test_empty_list_reports_missing_category(self):
+        with mock.patch("admin.models.keyset_page", return_value=([], None)), \
+                mock.patch("admin.models.resolver") as resolver:
+            resolver.resolve.side_effect=ValueError("category not found")
+            with self.assertRaisesMessage(ValueError, "category not found"):
+                Product.products_list("BMW", "X5", "BRK")
+
+    def test_in_stock_excludes_fully_reserved(self):
+        query=Product.list_filters(in_stock=True)
+        self.assertEqual(query["$expr"], {"$gt": ["$stock", {"$ifNull": ["$reserved", 0]}]})
+        self.assertEqual(query["stock"], {"$gt": 0})
+
+
+    def test_lookup_fallback_runs_on_pre_5_0_servers(self):
+        def lookups(stages):
+            for stage in stages:
+                if "$lookup" in stage:
+                    yield stage["$lookup"]
+                    yield from lookups(stage["$lookup"].get("pipeline", []))
+        with mock.patch("admin.models.products_collection") as products, \
+                mock.patch("admin.models.resolver") as resolver, \
+                mock.patch("admin.models.brands_collection") as brands:
+            products.find_one.return_value=None
+            resolver.peek.return_value=None
+            brands.aggregate.return_value=[]
+            with self.assertRaisesMessage(ValueError, "brand not found"):
+                Product.product_lookup("BMW", "X5", "BRK", "P1")
+        stages=list(lookups(brands.aggregate.call_args[0][0]))
+        self.assertEqual(len(stages), 3)
+        for stage in stages:
+            self.assertNotIn("localField", stage)
+            self.assertIn("let", stage)
+
+    def test_search_defaults_to_regex(self):
+        with mock.patch("admin.models.keyset_page", return_value=([], "next")) as page, \
+                mock.patch("admin.models.products_collection") as products:
+            _, next_cursor=Product.product_search("BMW", "X5", "BRK", "pad", cursor="abc")
+        products.find.assert_not_called()
+        self.assertEqual(page.call_args[0][1]["$or"][0], {"product_name": {"$regex": "pad", "$options": "i"}})
+        self.assertEqual(next_cursor, "next")
+
+    def test_text_search_rejects_cursor(self):
+        with self.assertRaisesMessage(ValueError, "cursor is not supported with mode=text"):
+            Product.product_search("BMW", "X5", "BRK", "pad", cursor="abc", mode="text")
+
+
+def catalog_entries():
+    brand, model, category=ObjectId(), ObjectId(), ObjectId()
+    entry=lambda kind, doc_id, name, code, parent_id=None, full_code=None: {
+        "type": kind, "_id": doc_id, "name": name, "code": code, "full_code": full_code, "parent_id": parent_id,
+    }
+    return [
+        entry("brand", brand, "Bremboline", "BRM"),
+        entry("model", model, "Pulsar 150", "P150", brand),
+        entry("category", category, "Brakes", "BRK", model),
+        entry("product", ObjectId(), "Brake Pad Front", "PAD1", category, "BRM-P150-BRK-PAD1"),
+        entry("product", ObjectId(), "Brake Shoe", "SHOE1", category, "BRM-P150-BRK-SHOE1"),
+        entry("product", ObjectId(), "Orphan Pad", "ORP", ObjectId()),
+    ]
+
+
+class TrigramTests(SimpleTestCase):
+    def test_tokens_are_padded_on_both_sides(self):
+        self.assertEqual(trigrams("ab cd"), {"  a", " ab", "ab ", "  c", " cd", "cd "})
+
+    def test_query_grams_cover_mid_word_substrings(self):
+        self.assertLessEqual(query_trigrams("ake"), trigrams("brake"))
+        self.assertEqual(query_trigrams("x5"), {"  x", " x5"})
+
+
+class CatalogSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.index=CatalogIndex()
+        self.index.load(catalog_entries())
+
+    def names(self, hits):
+        return [hit["name"] for hit in hits]
+
+    def test_matches_mid_word_substring(self):
+        self.assertIn("Brake Pad Front", self.names(self.index.search("ake")))
+
+    def test_word_order_does_not_matter(self):
+        self.assertEqual(self.names(self.index.search("pad brake")), ["Brake Pad Front"])
+        self.assertEqual(self.names(self.index.search("brake pad")), ["Brake Pad Front"])
+
+    def test_candidates_must_contain_every_token(self):
+        self.assertEqual(self.index.search("brake pedal"), [])
+
+    def test_hits_carry_full_path_and_skip_orphans(self):
+        hits=self.index.search("pad")
+        self.assertEqual(self.names(hits), ["Brake Pad Front"])
+        self.assertEqual(hits[0]["path"], {"brand_code": "BRM", "model_code": "P150", "category_code": "BRK", "product_code": "PAD1"})
+
+    def test_short_queries_return_nothing(self):
+        self.assertEqual(self.index.search("b"), [])
+
+    def test_apply_change_updates_index(self):
+        self.index.apply_change({
+            "ns": {"coll": products_collection.name},
+            "operationType": "delete",
+            "documentKey": {"_id": next(e["_id"] for e in self.index.entries.values() if e["name"]=="Brake Shoe")},
+        })
+        self.assertEqual(self.index.search("shoe"), [])
+
+
+class CatalogIndexBuildTests(SimpleTestCase):
+    def setUp(self):
+        self.index=CatalogIndex(ttl=30)
+
+    def build_on(self, started, release):
+        def build():
+            started.set()
+            release.wait(5)
+            self.index.load(catalog_entries())
+        return build
+
+    def test_first_request_does_not_build_inline(self):
+        started, release=threading.Event(), threading.Event()
+        with mock.patch.object(self.index, "_build", side_effect=self.build_on(started, release)) as build:
+            with self.assertRaisesMessage(RuntimeError, "catalog index is still loading"):
+                self.index.search("pad")
+            self.assertTrue(started.wait(5))
+            with self.assertRaises(RuntimeError):
+                self.index.search("pad")
+            release.set()
+            self.index.build()
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual([hit["name"] for hit in self.index.search("pad")], ["Brake Pad Front"])
+
+    def test_concurrent_rebuilds_run_once(self):
+        started, release=threading.Event(), threading.Event()
+        with mock.patch.object(self.index, "_build", side_effect=self.build_on(started, release)) as build:
+            first=threading.Thread(target=self.index.rebuild)
+            first.start()
+            self.assertTrue(started.wait(5))
+            self.index.rebuild()
+            release.set()
+            first.join()
+        self.assertEqual(build.call_count, 1)
+
+    def test_expired_index_serves_stale_while_rebuilding(self):
+        self.index.load(catalog_entries())
+        self.index.expires_at=0
+        with mock.patch("admin.search.threading.Thread") as thread:
+            self.assertTrue(self.index.search("pad"))
+        thread.assert_called_once_with(target=self.index.rebuild, daemon=True)
+        self.index.live=True
+        with mock.patch("admin.search.threading.Thread") as thread:
+            self.index.search("pad")
+        thread.assert_not_called()
+
+
+class AutocompleteTests(SimpleTestCase):
+    def setUp(self):
+        self.index=CatalogIndex()
+        entries=catalog_entries()
+        category=entries[2]["_id"]
+        entries+=[
+            {"type": "product", "_id": ObjectId(), "name": f"Brake Cable {i:03}", "code": f"C{i:03}",
+             "full_code": f"BRM-P150-BRK-C{i:03}", "parent_id": category}
+            for i in range(200)
+        ]
+        self.index.load(entries)
+
+    def test_higher_ranked_kinds_survive_popular_prefixes(self):
+        hits=self.index.autocomplete("br", limit=5)
+        self.assertEqual([hit["type"] for hit in hits[:2]], ["brand", "category"])
+        self.assertEqual(len(hits), 5)
+
+    def test_types_filter(self):
+        hits=self.index.autocomplete("br", limit=3, types=["product"])
+        self.assertEqual({hit["type"] for hit in hits}, {"product"})
+
+    def test_composite_code_prefix(self):
+        hits=self.index.autocomplete("brm-p150-brk-pa", limit=5)
+        self.assertEqual([hit["name"] for hit in hits], ["Brake Pad Front"])
+
+    def test_incremental_removal(self):
+        pad=next(e for e in self.index.entries.values() if e["name"]=="Brake Pad Front")
+        self.index.apply_change({"ns": {"coll": products_collection.name}, "operationType": "delete", "documentKey": {"_id": pad["_id"]}})
+        self.assertEqual(self.index.autocomplete("brake pad"), [])
+
+
+class CatalogVersionsTests(SimpleTestCase):
+    def setUp(self):
+        self.versions=CatalogVersions()
+
+    def test_started_is_whole_seconds(self):
+        self.assertEqual(self.versions.started.microsecond, 0)
+        self.versions.reset()
+        self.assertEqual(self.versions.started.microsecond, 0)
+
+    def test_touch_bumps_parent_list_and_subtree(self):
+        self.versions.started-=timedelta(seconds=10)
+        before=self.versions.last_modified(("BMW",))
+        self.versions.touch(("BMW", "X5"))
+        self.assertEqual(self.versions.last_modified(()), before)
+        self.assertGreater(self.versions.last_modified(("BMW",)), before)
+        self.assertGreater(self.versions.last_modified(("BMW", "X5", "BRK")), before)
+        self.assertEqual(self.versions.last_modified(("AUDI",)), self.versions.started)
+
+    def test_touch_list_only_bumps_that_list(self):
+        self.versions.started-=timedelta(seconds=10)
+        self.versions.touch_list(("BMW",))
+        self.assertGreater(self.versions.last_modified(("BMW",)), self.versions.started)
+        self.assertEqual(self.versions.last_modified(("BMW", "X5")), self.versions.started)
+
+    def test_reset_forgets_marks(self):
+        self.versions.touch(("BMW",))
+        self.versions.reset()
+        self.assertEqual(self.versions.last_modified(("BMW",)), self.versions.started)
+
+
+class CatalogChangeOrderTests(SimpleTestCase):
+    def test_caches_are_invalidated_before_versions_move(self):
+        calls=mock.MagicMock()
+        brand_id=ObjectId()
+        with mock.patch.object(events, "catalog_index") as index, \
+                mock.patch.object(events, "catalog_versions", calls.versions), \
+                mock.patch.object(events, "response_cache", calls.cache), \
+                mock.patch.object(events, "catalog_snapshot", calls.snapshot), \
+                mock.patch.object(events, "resolver"):
+            index.built=True
+            index.path.return_value={"brand_code": "BMW"}
+            events.handle_catalog_change({
+                "ns": {"coll": brands_collection.name},
+                "operationType": "update",
+                "documentKey": {"_id": brand_id},
+                "updateDescription": {"updatedFields": {"brand_name": "Bmw"}},
+            })
+        names=[name for name, _, _ in calls.mock_calls]
+        self.assertLess(names.index("cache.invalidate_node"), names.index("versions.touch"))
+        self.assertLess(names.index("snapshot.invalidate"), names.index("versions.touch"))
+
+
+class ReservedCounterTests(SimpleTestCase):
+    def setUp(self):
+        self.product_id=ObjectId()
+        self.calls=mock.MagicMock()
+        patches=[
+            mock.patch.object(events, "catalog_index"),
+            mock.patch.object(events, "catalog_versions", self.calls.versions),
+            mock.patch.object(events, "response_cache", self.calls.cache),
+            mock.patch.dict(events.stock_states, clear=True),
+        ]
+        index=patches[0].start()
+        for patch in patches[1:]:
+            patch.start()
+        self.addCleanup(mock.patch.stopall)
+        index.built=True
+        index.path.return_value={"brand_code": "BMW", "model_code": "X5", "category_code": "BRK", "product_code": "P1"}
+
+    def reserve(self, reserved, stock=2):
+        events.handle_counter_update({
+            "ns": {"coll": products_collection.name},
+            "operationType": "update",
+            "documentKey": {"_id": self.product_id},
+            "updateDescription": {"updatedFields": {"reserved": reserved}},
+            "fullDocument": {"_id": self.product_id, "stock": stock, "reserved": reserved},
+        })
+        names=[name for name, _, _ in self.calls.mock_calls]
+        self.calls.reset_mock()
+        return names
+
+    def test_invalidates_only_when_availability_flips(self):
+        self.assertEqual(self.reserve(1), ["cache.invalidate_node", "versions.touch"])
+        self.assertEqual(self.reserve(0), [])
+        self.assertEqual(self.reserve(2), ["cache.invalidate_node", "versions.touch"])
+        self.assertEqual(self.reserve(2), [])
+        self.assertEqual(self.reserve(1), ["cache.invalidate_node", "versions.touch"])
+
+    def test_catalog_change_forgets_known_state(self):
+        self.reserve(1)
+        with mock.patch.object(events, "catalog_snapshot"), mock.patch.object(events, "update_product_counts"):
+            events.handle_catalog_change({
+                "ns": {"coll": products_collection.name},
+                "operationType": "update",
+                "documentKey": {"_id": self.product_id},
+                "updateDescription": {"updatedFields": {"stock": 1}},
+            })
+        self.calls.reset_mock()
+        self.assertEqual(self.reserve(0, stock=1), ["cache.invalidate_node", "versions.touch"])
+
+
+class CatalogSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.snapshot=CatalogSnapshot(ttl=30)
+
+    def test_product_change_only_drops_its_category(self):
+        self.snapshot.summaries={("B", "M", "C1"): [], ("B", "M", "C2"): [], ("A", "M", "C1"): []}
+        self.snapshot.invalidate(("B", "M", "C1", "P1"), products_only=True)
+        self.assertEqual(set(self.snapshot.summaries), {("B", "M", "C2"), ("A", "M", "C1")})
+        self.assertEqual(self.snapshot.dirty, {False: set(), True: {"B"}})
+
+    def test_brand_change_drops_brand_summaries(self):
+        self.snapshot.summaries={("B", "M", "C1"): [], ("A", "M", "C1"): []}
+        self.snapshot.invalidate(("B",))
+        self.assertEqual(set(self.snapshot.summaries), {("A", "M", "C1")})
+        self.assertEqual(self.snapshot.dirty, {False: {"B"}, True: {"B"}})
+
+    def test_summaries_use_effective_price_and_skip_cached_categories(self):
+        category_id=ObjectId()
+        self.snapshot.summaries={("B", "M", "C2"): ["cached"]}
+        with mock.patch("admin.snapshot.products_collection") as products:
+            products.find.return_value.sort.return_value=[
+                {"_id": ObjectId(), "category_id": category_id, "product_code": "P1", "price": 10, "effective_price": 8},
+            ]
+            summaries=self.snapshot.product_summaries({("B", "M", "C1"): category_id, ("B", "M", "C2"): ObjectId()}, self.snapshot.generation)
+        self.assertEqual(products.find.call_args[0][0], {"category_id": {"$in": [category_id]}})
+        self.assertEqual(summaries[("B", "M", "C1")][0]["effective_price"], 8)
+        self.assertEqual(summaries[("B", "M", "C2")], ["cached"])
+
+    def test_summaries_fetched_during_invalidation_are_not_cached(self):
+        with mock.patch("admin.snapshot.products_collection") as products:
+            products.find.return_value.sort.return_value=[]
+            self.snapshot.product_summaries({("B", "M", "C1"): ObjectId()}, self.snapshot.generation-1)
+        self.assertEqual(self.snapshot.summaries, {})
+
+    def test_not_live_reuses_blob_until_ttl(self):
+        with mock.patch("admin.snapshot.catalog_versions") as versions, \
+                mock.patch.object(self.snapshot, "refresh", side_effect=lambda products, full: ({"B": b"{}"}, self.snapshot.generation, 1)) as refresh, \
+                mock.patch("admin.snapshot.time.monotonic", return_value=100):
+            versions.live=False
+            first=self.snapshot.get()
+            self.assertEqual(self.snapshot.get(), first)
+            self.assertEqual(refresh.call_count, 1)
+            self.assertEqual(first[0], b'{"brands":[{}]}')
+
+
+class PriceStateTests(SimpleTestCase):
+    offers={"discount": 20, "validity": {"from": 100, "to": 200}}
+
+    def test_no_offer(self):
+        self.assertEqual(price_state(50, {}, 150), (50, None))
+        self.assertEqual(price_state(None, None, 150), (0, None))
+
+    def test_before_offer_schedules_start(self):
+        self.assertEqual(price_state(50, self.offers, 99), (50, 100))
+
+    def test_during_offer_schedules_end(self):
+        self.assertEqual(price_state(50, self.offers, 100), (40.0, 201))
+        self.assertEqual(price_state(50, self.offers, 200), (40.0, 201))
+
+    def test_after_offer(self):
+        self.assertEqual(price_state(50, self.offers, 201), (50, None))
+
+    def test_pricing_update_unsets_finished_schedule(self):
+        self.assertEqual(pricing_update(50, self.offers, 300), {"$set": {"effective_price": 50}, "$unset": {"next_price_transition": ""}})
+        self.assertEqual(pricing_update(50, self.offers, 150), {"$set": {"effective_price": 40.0, "next_price_transition": 201}})
+
+    def test_apply_due_transitions_guards_on_current_state(self):
+        doc={"_id": ObjectId(), "price": 50, "offers": self.offers, "next_price_transition": 100}
+        with mock.patch("admin.pricing.products_collection") as products, \
+                mock.patch("admin.pricing.time.time", return_value=150):
+            products.find.return_value.sort.return_value.limit.return_value=[doc]
+            products.update_one.return_value.modified_count=1
+            self.assertEqual(apply_due_transitions(batch_size=1), (1, True))
+        query, update=products.update_one.call_args[0]
+        self.assertEqual(query, {"_id": doc["_id"], "price": 50, "offers": self.offers, "next_price_transition": 100})
+        self.assertEqual(update, {"$set": {"effective_price": 40.0, "next_price_transition": 201}})
+
+
+class CheckpointTests(SimpleTestCase):
+    def test_history_lost_codes(self):
+        for code in (136, 280, 286):
+            self.assertTrue(is_history_lost(OperationFailure("lost", code=code)))
+        self.assertFalse(is_history_lost(OperationFailure("other", code=11000)))
+        self.assertFalse(is_history_lost(AutoReconnect("down")))
+
+    def test_round_trip(self):
+        with mock.patch("admin.checkpoints.checkpoints_collection") as checkpoints:
+            checkpoints.find_one.return_value=None
+            self.assertIsNone(load_checkpoint("events"))
+            checkpoints.find_one.return_value={"_id": "events", "resume_token": {"_data": "82"}}
+            self.assertEqual(load_checkpoint("events"), {"_data": "82"})
+            save_checkpoint("events", {"_data": "83"})
+            clear_checkpoint("events")
+        query, update=checkpoints.update_one.call_args[0]
+        self.assertEqual(query, {"_id": "events"})
+        self.assertEqual(update["$set"]["resume_token"], {"_data": "83"})
+        self.assertTrue(checkpoints.update_one.call_args[1]["upsert"])
+        checkpoints.delete_one.assert_called_with({"_id": "events"})
+
+
+class StopWatching(BaseException):
+    pass
+
+
+class WatchResumeTests(SimpleTestCase):
+    def watch(self, token, changes):
+        stream=mock.MagicMock()
+        stream.__enter__.return_value=stream
+        stream.alive=True
+        stream.resume_token=token
+        stream.try_next.side_effect=list(changes)+[StopWatching()]
+        calls=mock.MagicMock()
+        with mock.patch.object(events, "load_checkpoint", return_value=token), \
+                mock.patch.object(events, "save_checkpoint"), \
+                mock.patch.object(events, "dispatch", calls.dispatch), \
+                mock.patch.object(events, "reconcile_product_counts", calls.reconcile), \
+                mock.patch.object(events.settings, "MONGO_DB") as db:
+            db.watch.return_value=stream
+            with self.assertRaises(StopWatching):
+                events.watch_database()
+        return [name for name, _, _ in calls.mock_calls]
+
+    def test_reconciles_counts_once_replay_catches_up(self):
+        delete={"operationType": "delete", "documentKey": {"_id": ObjectId()}}
+        self.assertEqual(self.watch({"_data": "82"}, [delete, None, None]), ["dispatch", "reconcile"])
+
+    def test_fresh_start_does_not_reconcile(self):
+        self.assertEqual(self.watch(None, [None]), [])
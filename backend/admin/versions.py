@@ -0,0 +1,43 @@
+import threading
+from datetime import datetime, timezone
+
+
+class CatalogVersions:
+    def __init__(self):
+        self.started=datetime.now(timezone.utc).replace(microsecond=0)
+        self.lists={}
+        self.subtrees={}
+        self.live=False
+        self._lock=threading.Lock()
+
+    def touch(self, path):
+        if path is None:
+            return
+        at=datetime.now(timezone.utc)
+        with self._lock:
+            parent=path[:-1]
+            if self.lists.get(parent, self.started)<at:
+                self.lists[parent]=at
+            if self.subtrees.get(path, self.started)<at:
+                self.subtrees[path]=at
+
+    def touch_list(self, path):
+        at=datetime.now(timezone.utc)
+        with self._lock:
+            if self.lists.get(path, self.started)<at:
+                self.lists[path]=at
+
+    def reset(self):
+        with self._lock:
+            self.started=datetime.now(timezone.utc).replace(microsecond=0)
+            self.lists.clear()
+            self.subtrees.clear()
+
+    def last_modified(self, path):
+        with self._lock:
+            marks=[self.started, self.lists.get(path, self.started)]
+            marks.extend(self.subtrees.get(path[:i], self.started) for i in range(1, len(path)+1))
+        return max(marks)
+
+
+catalog_versions=CatalogVersions()
@@ -12,6 +12,8 @@ import re
 
 
 class Auth:
+    __slots__=("id", "username", "phone_number", "password_hash", "created_at")
+
     def __init__(self, username, phone_number, password_hash, created_at=None, _id=None):
         self.id=_id
         self.username=username
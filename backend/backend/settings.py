@@ -23,6 +23,24 @@ MONGO_DB_NAME="MySpares_db"
 client=MongoClient(MONGO_URI)
 MONGO_DB=client[MONGO_DB_NAME]
 
+CATALOG_RESOLVER_SIZE=4096
+CATALOG_RESOLVER_TTL=5
+CATALOG_INDEX_TTL=300
+
+CART_HOLD_MINUTES=120
+
+WATCHER_CHECKPOINT={
+    "EVENTS": 100,
+    "SECONDS": 10,
+}
+
+RESPONSE_CACHE={
+    "BACKEND": os.getenv("RESPONSE_CACHE_BACKEND", "local"),
+    "ALIAS": "default",
+    "MAX_ENTRIES": 2048,
+    "TTL": 300,
+}
+
 TWILIO_ACCOUNT_SID=os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN=os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_VERIFY_SID=os.getenv("TWILIO_VERIFY_SID")
@@ -74,7 +92,7 @@ WSGI_APPLICATION='backend.wsgi.application'
 
 REST_FRAMEWORK={
     "DEFAULT_AUTHENTICATION_CLASSES": (),
-    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_RENDERER_CLASSES': ['utility.renderers.FastJSONRenderer'],
     'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
 }
 
@@ -4,4 +4,15 @@ from django.conf import settings
 users_collection=settings.MONGO_DB["users"]
 addresses_collection=settings.MONGO_DB["addresses"]
 products_collection=settings.MONGO_DB["products"]
-carts_collection=settings.MONGO_DB["carts"]
\ No newline at end of file
+carts_collection=settings.MONGO_DB["carts"]
+holds_collection=settings.MONGO_DB["stock_holds"]
+demand_collection=settings.MONGO_DB["product_demand"]
+
+carts_collection.create_index("user_id", unique=True)
+holds_collection.create_index(
+    [("user_id", 1), ("product_id", 1)],
+    unique=True, partialFilterExpression={"active": True}
+)
+holds_collection.create_index([("active", 1), ("expires_at", 1)])
+holds_collection.create_index([("product_id", 1), ("active", 1)])
+holds_collection.create_index("released_at", expireAfterSeconds=86400)
\ No newline at end of file
@@ -0,0 +1,50 @@
+from pymongo import UpdateOne
+from .admin import *
+
+
+class Demand:
+    @staticmethod
+    def changes(old_items, new_items):
+        changes={}
+        for sign, items in ((-1, old_items), (1, new_items)):
+            for item in items or []:
+                quantity, carts=changes.get(item["product_id"], (0, 0))
+                changes[item["product_id"]]=(quantity+sign*item["quantity"], carts+sign)
+        return {product_id: change for product_id, change in changes.items() if change!=(0, 0)}
+
+    @staticmethod
+    def apply(changes):
+        if not changes:
+            return
+        demand_collection.bulk_write([
+            UpdateOne({"_id": product_id}, {"$inc": {"quantity": quantity, "carts": carts}}, upsert=True)
+            for product_id, (quantity, carts) in changes.items()
+        ], ordered=False)
+
+    @staticmethod
+    def get(product_id):
+        doc=demand_collection.find_one({"_id": product_id})
+        if not doc:
+            return 0, 0
+        return doc.get("quantity", 0), doc.get("carts", 0)
+
+    @staticmethod
+    def set(product_id, quantity, carts):
+        if carts<=0:
+            demand_collection.delete_one({"_id": product_id})
+            return
+        demand_collection.update_one({"_id": product_id}, {"$set": {"quantity": quantity, "carts": carts}}, upsert=True)
+
+    @staticmethod
+    def discard(product_id):
+        demand_collection.delete_one({"_id": product_id})
+
+    @staticmethod
+    def rebuild():
+        carts_collection.aggregate([
+            {"$unwind": "$items"},
+            {"$match": {"items.quantity": {"$gt": 0}}},
+            {"$group": {"_id": "$items.product_id", "quantity": {"$sum": "$items.quantity"}, "carts": {"$sum": 1}}},
+            {"$out": demand_collection.name},
+        ])
+        return demand_collection.estimated_document_count()
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from client.admin import *
+from client.reservations import Reservation
+
+
+class Command(BaseCommand):
+    help="create stock holds for cart lines that predate reservations and rebuild products.reserved from them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--minutes", type=int, default=settings.CART_HOLD_MINUTES, help="hold lifetime from now for backfilled lines")
+
+    def handle(self, *args, **options):
+        chunk_size=options["chunk_size"]
+        now=datetime.now(timezone.utc)
+        expires_at=now+timedelta(minutes=options["minutes"])
+        last_id=None
+        created=0
+        while True:
+            query={"items.0": {"$exists": True}}
+            if last_id is not None:
+                query["_id"]={"$gt": last_id}
+            docs=list(carts_collection.find(query, {"user_id": 1, "items": 1}).sort("_id", 1).limit(chunk_size))
+            if not docs:
+                break
+            ops=[
+                UpdateOne(
+                    {"user_id": doc["user_id"], "product_id": item["product_id"], "active": True},
+                    {"$setOnInsert": {"quantity": item["quantity"], "expires_at": expires_at, "created_at": now}},
+                    upsert=True
+                )
+                for doc in docs for item in doc["items"] if item.get("quantity", 0)>0
+            ]
+            if ops:
+                try:
+                    created+=holds_collection.bulk_write(ops, ordered=False).upserted_count
+                except BulkWriteError as e:
+                    created+=e.details.get("nUpserted", 0)
+            last_id=docs[-1]["_id"]
+            self.stdout.write(f"[BACKFILL] {created} holds created")
+        Reservation.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"backfill complete: {created} holds created, reserved counters rebuilt from active holds"))
@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from client.admin import *
+from client.demand import Demand
+from client.models import Cart
+from client.reservations import Reservation
+
+
+class Command(BaseCommand):
+    help="fire concurrent Cart.add_item calls at one cart and verify that no quantity is lost"
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_id")
+        parser.add_argument("--adds", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--carts", type=int, default=1, help="spread the adds over this many carts")
+
+    def cleanup(self, user_ids, product_id):
+        total=0
+        changes={}
+        for cart in carts_collection.find({"user_id": {"$in": user_ids}}):
+            total+=sum(item["quantity"] for item in cart["items"] if item["product_id"]==product_id)
+            for changed_id, (delta, carts) in Demand.changes(cart["items"], []).items():
+                previous=changes.get(changed_id, (0, 0))
+                changes[changed_id]=(previous[0]+delta, previous[1]+carts)
+        Demand.apply(changes)
+        demand_collection.delete_many({"_id": {"$in": list(changes)}, "carts": {"$lte": 0}})
+        for hold in holds_collection.find({"user_id": {"$in": user_ids}, "active": True}):
+            Reservation.release(hold["user_id"], hold["product_id"], hold["quantity"])
+        carts_collection.delete_many({"user_id": {"$in": user_ids}})
+        return total
+
+    def handle(self, *args, **options):
+        product_id=ObjectId(options["product_id"])
+        available=Reservation.available(product_id)
+        if available is None:
+            raise CommandError("product not found")
+        adds=options["adds"]
+        user_ids=[ObjectId() for _ in range(options["carts"])]
+        if available<adds:
+            raise CommandError(f"only {available} items of the product are unreserved, below the {adds} adds")
+        jobs=[user_ids[i%len(user_ids)] for i in range(adds)]
+        errors=[]
+
+        def add(user_id):
+            try:
+                Cart.add_item(str(user_id), str(product_id), 1)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            started=time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                list(pool.map(add, jobs))
+            elapsed=time.perf_counter()-started
+        finally:
+            total=self.cleanup(user_ids, product_id)
+        self.stdout.write(
+            f"[BENCH] {adds} adds over {len(user_ids)} carts with {options['workers']} workers: "
+            f"{elapsed*1000:.0f} ms, {adds/elapsed:.0f} adds/s, {len(errors)} errors"
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f"[BENCH] first error: {errors[0]!r}"))
+        if total!=adds-len(errors):
+            raise CommandError(f"lost updates: expected quantity {adds-len(errors)}, found {total}")
+        self.stdout.write(self.style.SUCCESS(f"[BENCH] no lost updates: final quantity {total}"))
@@ -1,9 +1,22 @@
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from .admin import *
+from utility.serializers import serialize_cart, serialize_product
+from .pricebook import price_entry, pricebook, unit_price
+from .demand import Demand
+from .reservations import Reservation
 
 
 class Cart:
+    __slots__=("id", "user_id", "items", "subtotal", "created_at", "updated_at")
+    max_operations=50
+    expand_fields=(
+        "_id", "brand_code", "model_code", "category_code", "product_name", "product_code", "code",
+        "price", "effective_price", "stock", "image_url", "offers"
+    )
+
     def __init__(self, user_id, items=None, created_at=None, updated_at=None, subtotal=0, _id=None):
         self.id=_id
         self.user_id=ObjectId(user_id) if not isinstance(user_id, ObjectId) else user_id
@@ -58,24 +71,13 @@ class Cart:
         if not items:
             return 0.0
         now=datetime.now(timezone.utc).timestamp()
-        product_ids=[item["product_id"] for item in items]
-        products=products_collection.find({"_id": {"$in": product_ids}})
-        product_map={p["_id"]: p for p in products}
+        entries=pricebook.get_many([item["product_id"] for item in items])
         subtotal=0
         for item in items:
-            product=product_map.get(item["product_id"])
-            if not product:
+            entry=entries.get(item["product_id"])
+            if not entry:
                 continue
-            price=product.get("price", 0)
-            offers=product.get("offers", {})
-            if offers:
-                discount=offers.get("discount", 0)
-                validity=offers.get("validity", {})
-                from_ts=validity.get("from", 0)
-                to_ts=validity.get("to", 0)
-                if from_ts <= now <= to_ts:
-                    price*=(1-(discount/100))
-            subtotal+=price*item["quantity"]
+            subtotal+=unit_price(entry, now)*item["quantity"]
         return round(subtotal, 2)
 
     @classmethod
@@ -85,71 +87,219 @@ class Cart:
             return cls(user_id=user_id)
         return cls.from_dict(doc)
 
+    @classmethod
+    def expanded(cls, user_id):
+        docs=list(carts_collection.aggregate([
+            {"$match": {"user_id": ObjectId(user_id)}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": products_collection.name,
+                "localField": "items.product_id",
+                "foreignField": "_id",
+                "as": "products",
+            }},
+            {"$project": {
+                "user_id": 1, "items": 1, "subtotal": 1, "created_at": 1, "updated_at": 1,
+                **{f"products.{field}": 1 for field in cls.expand_fields+("next_price_transition",)},
+            }},
+        ]))
+        if not docs:
+            return serialize_cart({"user_id": ObjectId(user_id), "items": []})
+        doc=docs[0]
+        products={product["_id"]: product for product in doc.pop("products")}
+        now=datetime.now(timezone.utc).timestamp()
+        data=serialize_cart(doc)
+        subtotal=0
+        for line, item in zip(data["items"], doc.get("items", [])):
+            product=products.get(item["product_id"])
+            price=unit_price(price_entry(product), now) if product else 0
+            line["product"]=serialize_product(product, cls.expand_fields) if product else None
+            line["unit_price"]=price
+            line["line_total"]=round(price*item["quantity"], 2)
+            subtotal+=price*item["quantity"]
+        data["subtotal"]=round(subtotal, 2)
+        return data
+
     @classmethod
     def add_item(cls, user_id, product_id, quantity=1):
-        if not users_collection.find_one({"_id": ObjectId(user_id)}):
-            raise ValueError("user not found")
-        product=products_collection.find_one({"_id": ObjectId(product_id)})
-        if not product:
+        if quantity<1:
+            raise ValueError("quantity must be a positive integer")
+        user_id=ObjectId(user_id)
+        product_id=ObjectId(product_id)
+        entry=pricebook.get_many([product_id]).get(product_id)
+        if not entry:
             raise ValueError("product not found")
-        stock=product.get("stock", 0)
-        if stock<=0:
-            raise ValueError("product is out of stock")
+        Reservation.reserve(user_id, product_id, quantity)
         now=datetime.now(timezone.utc)
-        cart=carts_collection.find_one({"user_id": ObjectId(user_id)})
-        if not cart:
-            if quantity>stock:
-                raise ValueError(f"only {stock} items available in stock")
-            cart_doc={
-                "user_id": ObjectId(user_id),
-                "items": [{"product_id": ObjectId(product_id), "quantity": quantity, "added_at": now}],
-                "created_at": now,
-                "updated_at": now,
-            }
-            cart_doc["subtotal"]=cls.calculate_subtotal(cart_doc["items"])
-            result=carts_collection.insert_one(cart_doc)
-            cart_doc["_id"]=result.inserted_id
-            return cls.from_dict(cart_doc)
-        item_found=False
-        for item in cart["items"]:
-            if item["product_id"]==ObjectId(product_id):
-                new_quantity=item["quantity"]+quantity
-                if new_quantity>stock:
-                    raise ValueError(f"only {stock} items available in stock")
-                item["quantity"]=new_quantity
-                item_found=True
-                break
-        if not item_found:
-            if quantity>stock:
-                raise ValueError(f"only {stock} items available in stock")
-            cart["items"].append({"product_id": ObjectId(product_id), "quantity": quantity, "added_at": now})
-        cart["updated_at"]=now
-        cart["subtotal"]=cls.calculate_subtotal(cart["items"])
-        carts_collection.update_one({"_id": cart["_id"]}, {"$set": cart})
+        amount=round(unit_price(entry, now.timestamp())*quantity, 2)
+        new_line=False
+        try:
+            cart=cls.increment_item(user_id, product_id, quantity, amount, now)
+            if not cart:
+                try:
+                    cart=carts_collection.find_one_and_update(
+                        {"user_id": user_id, "items.product_id": {"$ne": product_id}},
+                        {
+                            "$push": {"items": {"product_id": product_id, "quantity": quantity, "added_at": now}},
+                            "$inc": {"subtotal": amount},
+                            "$set": {"updated_at": now},
+                            "$setOnInsert": {"created_at": now},
+                        },
+                        upsert=True, return_document=ReturnDocument.AFTER
+                    )
+                    new_line=True
+                except DuplicateKeyError:
+                    cart=cls.increment_item(user_id, product_id, quantity, amount, now)
+            if not cart:
+                raise RuntimeError("cart was modified concurrently, please retry")
+        except Exception:
+            Reservation.release(user_id, product_id, quantity)
+            raise
+        Demand.apply({product_id: (quantity, int(new_line))})
         return cls.from_dict(cart)
 
+    @staticmethod
+    def increment_item(user_id, product_id, quantity, amount, now):
+        return carts_collection.find_one_and_update(
+            {"user_id": user_id, "items.product_id": product_id},
+            {"$inc": {"items.$[item].quantity": quantity, "subtotal": amount}, "$set": {"updated_at": now}},
+            array_filters=[{"item.product_id": product_id}], return_document=ReturnDocument.AFTER
+        )
+
+    @classmethod
+    def apply_operations(cls, user_id, operations, max_retries=5):
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("operations must be a non-empty list")
+        if len(operations)>cls.max_operations:
+            raise ValueError(f"at most {cls.max_operations} operations per request")
+        parsed=[]
+        for op in operations:
+            if not isinstance(op, dict) or not ObjectId.is_valid(op.get("product_id")):
+                raise ValueError("each operation needs a valid product_id")
+            if ("quantity" in op)==("delta" in op):
+                raise ValueError("each operation needs exactly one of quantity or delta")
+            mode="quantity" if "quantity" in op else "delta"
+            try:
+                value=int(op[mode])
+            except (ValueError, TypeError):
+                raise ValueError(f"{mode} must be an integer")
+            if mode=="quantity" and value<0:
+                raise ValueError("quantity must not be negative")
+            parsed.append((ObjectId(op["product_id"]), mode, value))
+        user_id=ObjectId(user_id)
+        entries=pricebook.get_many(list({product_id for product_id, _, _ in parsed}))
+        for _ in range(max_retries):
+            cart=carts_collection.find_one({"user_id": user_id})
+            current=cart["items"] if cart else []
+            now=datetime.now(timezone.utc)
+            items={item["product_id"]: dict(item) for item in current}
+            for product_id, mode, value in parsed:
+                item=items.get(product_id)
+                quantity=(item["quantity"] if item else 0)+value if mode=="delta" else value
+                if quantity<=0:
+                    items.pop(product_id, None)
+                    continue
+                if product_id not in entries:
+                    raise ValueError(f"product not found: {product_id}")
+                if item:
+                    item["quantity"]=quantity
+                else:
+                    items[product_id]={"product_id": product_id, "quantity": quantity, "added_at": now}
+            new_items=list(items.values())
+            subtotal=cls.calculate_subtotal(new_items)
+            changes=Demand.changes(current, new_items)
+            deltas={product_id: quantity for product_id, (quantity, _) in changes.items() if quantity}
+            reserved=[]
+            try:
+                for product_id, delta in deltas.items():
+                    if delta>0:
+                        try:
+                            Reservation.reserve(user_id, product_id, delta)
+                        except ValueError as e:
+                            raise ValueError(f"{e} for product {product_id}")
+                        reserved.append((product_id, delta))
+                if cart:
+                    result=carts_collection.update_one(
+                        {"_id": cart["_id"], "items": current},
+                        {"$set": {"items": new_items, "subtotal": subtotal, "updated_at": now}}
+                    )
+                    written=result.matched_count>0
+                    if written:
+                        cart.update({"items": new_items, "subtotal": subtotal, "updated_at": now})
+                else:
+                    cart={"user_id": user_id, "items": new_items, "subtotal": subtotal, "created_at": now, "updated_at": now}
+                    try:
+                        cart["_id"]=carts_collection.insert_one(cart).inserted_id
+                        written=True
+                    except DuplicateKeyError:
+                        written=False
+            except Exception:
+                for product_id, delta in reserved:
+                    Reservation.release(user_id, product_id, delta)
+                raise
+            if written:
+                Demand.apply(changes)
+                for product_id, delta in deltas.items():
+                    if delta<0:
+                        Reservation.release(user_id, product_id, -delta)
+                return cls.from_dict(cart)
+            for product_id, delta in reserved:
+                Reservation.release(user_id, product_id, delta)
+        raise RuntimeError("cart was modified concurrently, please retry")
+
     @classmethod
     def remove_item(cls, user_id, product_id, quantity=1):
         now=datetime.now(timezone.utc)
-        result=carts_collection.update_one(
-            {"user_id": ObjectId(user_id), "items.product_id": ObjectId(product_id)},
-            {"$inc": {"items.$.quantity": -quantity}, "$set": {"updated_at": now}}
+        user_id=ObjectId(user_id)
+        product_id=ObjectId(product_id)
+        before=carts_collection.find_one_and_update(
+            {"user_id": user_id, "items.product_id": product_id},
+            {"$inc": {"items.$.quantity": -quantity}, "$set": {"updated_at": now}},
+            projection={"items.$": 1}
         )
-        if result.modified_count==0:
+        if not before:
             raise ValueError("cart or item not found")
+        held=before["items"][0]["quantity"]
+        Reservation.release(user_id, product_id, min(quantity, held))
+        Demand.apply({product_id: (-min(quantity, held), -1 if held<=quantity else 0)})
         carts_collection.update_one(
-            {"user_id": ObjectId(user_id)},
+            {"user_id": user_id},
             {"$pull": {"items": {"quantity": {"$lte": 0}}}, "$set": {"updated_at": now}}
         )
-        cart_doc=carts_collection.find_one({"user_id": ObjectId(user_id)})
+        cart_doc=carts_collection.find_one({"user_id": user_id})
         if not cart_doc:
             return cls(user_id=user_id)
         cart_doc["subtotal"]=cls.calculate_subtotal(cart_doc["items"])
         carts_collection.update_one({"_id": cart_doc["_id"]}, {"$set": {"subtotal": cart_doc["subtotal"], "updated_at": now}})
         return cls.from_dict(cart_doc)
 
+    @classmethod
+    def release_lines(cls, user_id, quantities, max_retries=3):
+        for _ in range(max_retries):
+            cart=carts_collection.find_one({"user_id": user_id})
+            if not cart:
+                return None
+            items=[]
+            for item in cart["items"]:
+                left=item["quantity"]-quantities.get(item["product_id"], 0)
+                if left>0:
+                    items.append({**item, "quantity": left})
+            result=carts_collection.update_one(
+                {"_id": cart["_id"], "items": cart["items"]},
+                {"$set": {"items": items, "subtotal": cls.calculate_subtotal(items), "updated_at": datetime.now(timezone.utc)}}
+            )
+            if result.matched_count:
+                Demand.apply(Demand.changes(cart["items"], items))
+                return cart["_id"]
+        return None
+
 
 class Address:
+    __slots__=(
+        "id", "user_id", "name", "phone_number", "address_line1", "address_line2",
+        "city", "state", "country", "pincode", "updated_at"
+    )
+
     def __init__(self, user_id, name=None, phone_number=None, address_line1=None, address_line2=None,
                  city=None, state=None, pincode=None, country=None, updated_at=None, _id=None):
         self.id=_id
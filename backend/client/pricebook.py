@@ -0,0 +1,89 @@
+import threading
+import time
+from admin.pricing import price_state
+from .admin import *
+
+PROJECTION={"price": 1, "effective_price": 1, "next_price_transition": 1, "offers": 1, "stock": 1}
+
+
+def price_entry(doc):
+    offers=doc.get("offers") or {}
+    validity=offers.get("validity", {})
+    return (
+        doc.get("price", 0),
+        doc.get("effective_price"),
+        doc.get("next_price_transition"),
+        offers.get("discount", 0) if offers else None,
+        validity.get("from", 0),
+        validity.get("to", 0),
+        doc.get("stock", 0),
+    )
+
+def unit_price(entry, now=None):
+    price, effective_price, next_transition, discount, from_ts, to_ts, _=entry
+    now=time.time() if now is None else now
+    if effective_price is not None and (next_transition is None or now<next_transition):
+        return effective_price
+    offers={"discount": discount, "validity": {"from": from_ts, "to": to_ts}} if discount is not None else {}
+    return price_state(price, offers, now)[0]
+
+
+class PriceBook:
+    def __init__(self):
+        self.entries={}
+        self.live=False
+        self.generation=0
+        self._lock=threading.Lock()
+
+    def put(self, doc):
+        entry=price_entry(doc)
+        with self._lock:
+            self.generation+=1
+            self.entries[doc["_id"]]=entry
+        return entry
+
+    def discard(self, product_id):
+        with self._lock:
+            self.generation+=1
+            self.entries.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation+=1
+            self.entries.clear()
+
+    def apply_change(self, change):
+        product_id=change["documentKey"]["_id"]
+        doc=change.get("fullDocument")
+        if change["operationType"]=="delete" or not doc:
+            self.discard(product_id)
+        else:
+            self.put(doc)
+
+    def fill(self, entries, generation):
+        with self._lock:
+            if generation!=self.generation:
+                return False
+            self.entries.update(entries)
+        return True
+
+    def get_many(self, product_ids):
+        found={}
+        missing=[]
+        with self._lock:
+            generation=self.generation
+            for product_id in product_ids:
+                entry=self.entries.get(product_id) if self.live else None
+                if entry is None:
+                    missing.append(product_id)
+                else:
+                    found[product_id]=entry
+        if missing:
+            fetched={doc["_id"]: price_entry(doc) for doc in products_collection.find({"_id": {"$in": missing}}, PROJECTION)}
+            if self.live:
+                self.fill(fetched, generation)
+            found.update(fetched)
+        return found
+
+
+pricebook=PriceBook()
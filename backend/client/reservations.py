@@ -0,0 +1,127 @@
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from django.conf import settings
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .admin import *
+
+
+class Reservation:
+    @staticmethod
+    def available(product_id):
+        product=products_collection.find_one({"_id": product_id}, {"stock": 1, "reserved": 1})
+        if not product:
+            return None
+        return max(0, product.get("stock", 0)-product.get("reserved", 0))
+
+    @classmethod
+    def reserve(cls, user_id, product_id, quantity):
+        if quantity<=0:
+            return
+        result=products_collection.update_one(
+            {"_id": product_id, "$expr": {"$gte": [
+                {"$subtract": ["$stock", {"$ifNull": ["$reserved", 0]}]}, quantity
+            ]}},
+            {"$inc": {"reserved": quantity}}
+        )
+        if result.modified_count==0:
+            available=cls.available(product_id)
+            if available is None:
+                raise ValueError("product not found")
+            if available<=0:
+                raise ValueError("product is out of stock")
+            raise ValueError(f"only {available} items available in stock")
+        now=datetime.now(timezone.utc)
+        hold_filter={"user_id": user_id, "product_id": product_id, "active": True}
+        hold_update={
+            "$inc": {"quantity": quantity},
+            "$set": {"expires_at": now+timedelta(minutes=settings.CART_HOLD_MINUTES)},
+            "$setOnInsert": {"created_at": now},
+        }
+        try:
+            holds_collection.update_one(hold_filter, hold_update, upsert=True)
+        except DuplicateKeyError:
+            holds_collection.update_one(hold_filter, hold_update)
+
+    @staticmethod
+    def release(user_id, product_id, quantity):
+        if quantity<=0:
+            return
+        hold=holds_collection.find_one_and_update(
+            {"user_id": user_id, "product_id": product_id, "active": True},
+            {"$inc": {"quantity": -quantity}}
+        )
+        if not hold:
+            return
+        released=min(quantity, hold["quantity"])
+        products_collection.update_one({"_id": product_id}, {"$inc": {"reserved": -released}})
+        holds_collection.update_one(
+            {"_id": hold["_id"], "quantity": {"$lte": 0}},
+            {"$set": {"active": False, "released_at": datetime.now(timezone.utc)}}
+        )
+
+    @staticmethod
+    def release_product(product_id):
+        holds_collection.update_many(
+            {"product_id": product_id, "active": True},
+            {"$set": {"active": False, "released_at": datetime.now(timezone.utc)}}
+        )
+        products_collection.update_one({"_id": product_id}, {"$set": {"reserved": 0}})
+
+    @staticmethod
+    def set_held(user_id, product_id, quantity):
+        if quantity>0:
+            holds_collection.update_one(
+                {"user_id": user_id, "product_id": product_id, "active": True},
+                {"$set": {"quantity": quantity}}
+            )
+        else:
+            holds_collection.update_one(
+                {"user_id": user_id, "product_id": product_id, "active": True},
+                {"$set": {"active": False, "released_at": datetime.now(timezone.utc)}}
+            )
+
+    @staticmethod
+    def reconcile(product_ids=None):
+        match={"active": True}
+        if product_ids is not None:
+            match["product_id"]={"$in": list(product_ids)}
+        held={
+            row["_id"]: row["quantity"] for row in
+            holds_collection.aggregate([{"$match": match}, {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}}}])
+        }
+        query={"_id": {"$in": list(product_ids)}} if product_ids is not None else {"reserved": {"$exists": True}}
+        ops=[
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"reserved": held.get(doc["_id"], 0)}})
+            for doc in products_collection.find(query, {"reserved": 1})
+            if doc.get("reserved", 0)!=held.get(doc["_id"], 0)
+        ]
+        ops+=[
+            UpdateOne({"_id": product_id, "reserved": {"$exists": False}}, {"$set": {"reserved": quantity}})
+            for product_id, quantity in held.items() if product_ids is None
+        ]
+        if ops:
+            products_collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    @staticmethod
+    def expire(batch_size=500):
+        now=datetime.now(timezone.utc)
+        holds=list(holds_collection.find({"active": True, "expires_at": {"$lte": now}}).limit(batch_size))
+        released=defaultdict(int)
+        carts=defaultdict(dict)
+        for hold in holds:
+            hold=holds_collection.find_one_and_update(
+                {"_id": hold["_id"], "active": True, "expires_at": {"$lte": now}},
+                {"$set": {"active": False, "released_at": now}},
+                return_document=ReturnDocument.BEFORE
+            )
+            if hold and hold["quantity"]>0:
+                released[hold["product_id"]]+=hold["quantity"]
+                carts[hold["user_id"]][hold["product_id"]]=hold["quantity"]
+        if released:
+            products_collection.bulk_write([
+                UpdateOne({"_id": product_id}, {"$inc": {"reserved": -quantity}})
+                for product_id, quantity in released.items()
+            ], ordered=False)
+        return carts, len(holds)==batch_size
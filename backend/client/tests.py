@@ -1,3 +1,211 @@
-from django.test import TestCase
+import os
+import threading
+from unittest import mock, skipUnless
+from bson import ObjectId
+from django.test import RequestFactory, SimpleTestCase
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from .models import Cart
+from .pricebook import PriceBook, price_entry, unit_price
+from .reservations import Reservation
+from .views import list_cart
 
-# Create your tests here.
+
+class PriceBookTests(SimpleTestCase):
+    def setUp(self):
+        self.book=PriceBook()
+        self.book.live=True
+        self.product_id=ObjectId()
+
+    def doc(self, price):
+        return {"_id": self.product_id, "price": price, "effective_price": price, "stock": 5}
+
+    def test_miss_fills_from_database(self):
+        with mock.patch("client.pricebook.products_collection") as products:
+            products.find.return_value=[self.doc(10)]
+            self.assertEqual(unit_price(self.book.get_many([self.product_id])[self.product_id]), 10)
+            self.book.get_many([self.product_id])
+        self.assertEqual(products.find.call_count, 1)
+
+    def test_stale_read_does_not_overwrite_newer_change(self):
+        def racing_find(*args, **kwargs):
+            self.book.apply_change({"operationType": "update", "documentKey": {"_id": self.product_id}, "fullDocument": self.doc(12)})
+            return [self.doc(10)]
+        with mock.patch("client.pricebook.products_collection") as products:
+            products.find.side_effect=racing_find
+            self.book.get_many([self.product_id])
+        self.assertEqual(self.book.entries[self.product_id], price_entry(self.doc(12)))
+
+    def test_not_live_never_caches(self):
+        self.book.live=False
+        with mock.patch("client.pricebook.products_collection") as products:
+            products.find.return_value=[self.doc(10)]
+            self.book.get_many([self.product_id])
+        self.assertEqual(self.book.entries, {})
+
+    def test_delete_discards_entry(self):
+        self.book.put(self.doc(10))
+        self.book.apply_change({"operationType": "delete", "documentKey": {"_id": self.product_id}})
+        self.assertNotIn(self.product_id, self.book.entries)
+
+    def test_unit_price_follows_offer_window(self):
+        entry=price_entry({"price": 100, "effective_price": 100, "next_price_transition": 50,
+                           "offers": {"discount": 10, "validity": {"from": 50, "to": 60}}})
+        self.assertEqual(unit_price(entry, 40), 100)
+        self.assertEqual(unit_price(entry, 55), 90.0)
+        self.assertEqual(unit_price(entry, 61), 100)
+
+
+class CartViewTests(SimpleTestCase):
+    def test_patch_rejects_non_object_body(self):
+        user_id=ObjectId()
+        request=RequestFactory().patch(f"/api/client/{user_id}/cart/", data=[{"product_id": "x"}], content_type="application/json")
+        with mock.patch("client.views.require_auth", return_value={"user_id": str(user_id)}), \
+                mock.patch("client.views.Cart.apply_operations") as apply_operations:
+            response=list_cart(request, user_id=str(user_id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "request body must be a JSON object"})
+        apply_operations.assert_not_called()
+
+
+class CartExpandedTests(SimpleTestCase):
+    def test_lookup_runs_on_pre_5_0_servers(self):
+        with mock.patch("client.models.carts_collection") as carts:
+            carts.aggregate.return_value=[]
+            Cart.expanded(ObjectId())
+        stages=carts.aggregate.call_args[0][0]
+        lookup=next(stage["$lookup"] for stage in stages if "$lookup" in stage)
+        self.assertNotIn("pipeline", lookup)
+        projection=stages[-1]["$project"]
+        self.assertEqual(projection["products.price"], 1)
+        self.assertNotIn("products.description", projection)
+
+
+class ReservationExpireTests(SimpleTestCase):
+    def test_releases_quantity_held_at_deactivation(self):
+        user_id, product_id=ObjectId(), ObjectId()
+        stale={"_id": ObjectId(), "user_id": user_id, "product_id": product_id, "quantity": 5}
+        with mock.patch("client.reservations.holds_collection") as holds, \
+                mock.patch("client.reservations.products_collection") as products:
+            holds.find.return_value.limit.return_value=[stale, {**stale, "_id": ObjectId()}]
+            holds.find_one_and_update.side_effect=[{**stale, "quantity": 2}, None]
+            carts, more=Reservation.expire(batch_size=10)
+        self.assertEqual(carts, {user_id: {product_id: 2}})
+        self.assertFalse(more)
+        ops=products.bulk_write.call_args[0][0]
+        self.assertEqual(ops[0]._doc, {"$inc": {"reserved": -2}})
+
+
+class AddItemTests(SimpleTestCase):
+    def setUp(self):
+        self.user_id, self.product_id=ObjectId(), ObjectId()
+        entry=price_entry({"price": 10, "effective_price": 10, "stock": 0})
+        mock.patch("client.models.pricebook.get_many", return_value={self.product_id: entry}).start()
+        self.demand=mock.patch("client.models.Demand").start()
+        self.carts=mock.patch("client.models.carts_collection").start()
+        self.products=mock.patch("client.reservations.products_collection").start()
+        self.holds=mock.patch("client.reservations.holds_collection").start()
+        self.addCleanup(mock.patch.stopall)
+        self.products.update_one.return_value.modified_count=1
+
+    def cart(self, quantity):
+        return {"_id": ObjectId(), "user_id": self.user_id, "items": [{"product_id": self.product_id, "quantity": quantity}], "subtotal": 10*quantity}
+
+    def test_reserve_is_conditional_on_unreserved_stock(self):
+        self.products.update_one.return_value.modified_count=0
+        self.products.find_one.return_value={"_id": self.product_id, "stock": 2, "reserved": 2}
+        with self.assertRaisesMessage(ValueError, "product is out of stock"):
+            Cart.add_item(self.user_id, self.product_id, 1)
+        query, update=self.products.update_one.call_args[0]
+        self.assertEqual(query["$expr"], {"$gte": [{"$subtract": ["$stock", {"$ifNull": ["$reserved", 0]}]}, 1]})
+        self.assertEqual(update, {"$inc": {"reserved": 1}})
+        self.carts.find_one_and_update.assert_not_called()
+
+    def test_existing_line_is_incremented_in_place(self):
+        self.carts.find_one_and_update.return_value=self.cart(3)
+        Cart.add_item(self.user_id, self.product_id, 2)
+        self.assertEqual(self.carts.find_one_and_update.call_count, 1)
+        query, update=self.carts.find_one_and_update.call_args[0]
+        self.assertEqual(query, {"user_id": self.user_id, "items.product_id": self.product_id})
+        self.assertEqual(update["$inc"], {"items.$[item].quantity": 2, "subtotal": 20})
+        self.assertEqual(self.carts.find_one_and_update.call_args[1]["array_filters"], [{"item.product_id": self.product_id}])
+        self.demand.apply.assert_called_with({self.product_id: (2, 0)})
+
+    def test_new_line_is_pushed_only_when_absent(self):
+        self.carts.find_one_and_update.side_effect=[None, self.cart(1)]
+        Cart.add_item(self.user_id, self.product_id, 1)
+        query, update=self.carts.find_one_and_update.call_args[0]
+        self.assertEqual(query, {"user_id": self.user_id, "items.product_id": {"$ne": self.product_id}})
+        self.assertEqual(update["$push"]["items"]["quantity"], 1)
+        self.assertTrue(self.carts.find_one_and_update.call_args[1]["upsert"])
+        self.demand.apply.assert_called_with({self.product_id: (1, 1)})
+
+    def test_racing_push_falls_back_to_increment(self):
+        self.carts.find_one_and_update.side_effect=[None, DuplicateKeyError("user_id"), self.cart(2)]
+        Cart.add_item(self.user_id, self.product_id, 1)
+        self.assertEqual(self.carts.find_one_and_update.call_args[0][0], {"user_id": self.user_id, "items.product_id": self.product_id})
+        self.demand.apply.assert_called_with({self.product_id: (1, 0)})
+
+    def test_failed_cart_write_releases_reservation(self):
+        self.carts.find_one_and_update.side_effect=[None, DuplicateKeyError("user_id"), None]
+        self.holds.find_one_and_update.return_value={"_id": ObjectId(), "quantity": 1}
+        with self.assertRaisesMessage(RuntimeError, "cart was modified concurrently"):
+            Cart.add_item(self.user_id, self.product_id, 1)
+        self.assertEqual(self.products.update_one.call_args_list[-1][0], ({"_id": self.product_id}, {"$inc": {"reserved": -1}}))
+        self.demand.apply.assert_not_called()
+
+
+@skipUnless(os.getenv("MONGO_TEST_URI"), "set MONGO_TEST_URI to a disposable mongod to run concurrency tests")
+class ConcurrentAddItemTests(SimpleTestCase):
+    def setUp(self):
+        self.client=MongoClient(os.getenv("MONGO_TEST_URI"))
+        self.db=self.client[f"test_cart_{ObjectId()}"]
+        self.addCleanup(self.client.close)
+        self.addCleanup(self.client.drop_database, self.db.name)
+        self.db["carts"].create_index("user_id", unique=True)
+        self.db["stock_holds"].create_index([("user_id", 1), ("product_id", 1)], unique=True, partialFilterExpression={"active": True})
+        self.product_id=ObjectId()
+        entry=price_entry({"price": 10, "effective_price": 10, "stock": 0})
+        patches=[
+            mock.patch("client.models.pricebook.get_many", return_value={self.product_id: entry}),
+            mock.patch("client.models.Demand"),
+            mock.patch("client.models.carts_collection", self.db["carts"]),
+            mock.patch("client.reservations.products_collection", self.db["products"]),
+            mock.patch("client.reservations.holds_collection", self.db["stock_holds"]),
+        ]
+        for patch in patches:
+            patch.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def run_adds(self, stock, user_ids):
+        self.db["products"].insert_one({"_id": self.product_id, "stock": stock, "reserved": 0})
+        barrier=threading.Barrier(len(user_ids))
+        errors=[]
+        def add(user_id):
+            barrier.wait()
+            try:
+                Cart.add_item(user_id, self.product_id, 1)
+            except ValueError as e:
+                errors.append(str(e))
+        threads=[threading.Thread(target=add, args=(user_id,)) for user_id in user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reserved=self.db["products"].find_one({"_id": self.product_id})["reserved"]
+        held=sum(hold["quantity"] for hold in self.db["stock_holds"].find({"active": True}))
+        in_carts=sum(item["quantity"] for cart in self.db["carts"].find() for item in cart["items"])
+        return reserved, held, in_carts, errors
+
+    def test_no_lost_increments_on_one_cart(self):
+        user_id=ObjectId()
+        reserved, held, in_carts, errors=self.run_adds(100, [user_id]*24)
+        self.assertEqual(errors, [])
+        self.assertEqual((reserved, held, in_carts), (24, 24, 24))
+        self.assertEqual(len(self.db["carts"].find_one({"user_id": user_id})["items"]), 1)
+
+    def test_reservations_never_exceed_stock(self):
+        users=[ObjectId() for _ in range(8)]
+        reserved, held, in_carts, errors=self.run_adds(15, users*3)
+        self.assertEqual((reserved, held, in_carts), (15, 15, 15))
+        self.assertEqual(errors, ["product is out of stock"]*9)
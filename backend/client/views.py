@@ -27,14 +27,21 @@ def require_auth(request, user_id):
 
 
 @handle_exceptions
-@api_view(["GET"])
+@api_view(["GET", "PATCH"])
 @authentication_classes([])
 @permission_classes([AllowAny])
 def list_cart(request, user_id):
     auth=require_auth(request, user_id)
     if isinstance(auth, Response):
         return auth
-    cart=Cart.get_cart(user_id)
+    if request.method=="PATCH":
+        if not isinstance(request.data, dict):
+            raise ValueError("request body must be a JSON object")
+        cart=Cart.apply_operations(str(user_id), request.data.get("operations"))
+    elif request.query_params.get("expand")=="products":
+        return Response({"cart": Cart.expanded(str(user_id))}, status=status.HTTP_200_OK)
+    else:
+        cart=Cart.get_cart(user_id)
     return Response({"cart": cart.to_dict()}, status=status.HTTP_200_OK)
 
 @handle_exceptions
@@ -57,7 +64,13 @@ def remove_from_cart(request, user_id, product_id):
     auth=require_auth(request, user_id)
     if isinstance(auth, Response):
         return auth
-    cart=Cart.remove_item(str(user_id), str(product_id))
+    try:
+        quantity=int(request.query_params.get("quantity", request.data.get("quantity", 1)))
+    except (ValueError, TypeError):
+        raise ValueError("quantity must be an integer")
+    if quantity<1:
+        raise ValueError("quantity must be a positive integer")
+    cart=Cart.remove_item(str(user_id), str(product_id), quantity)
     return Response({"cart": cart.to_dict()}, status=status.HTTP_200_OK)
 
 
@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.http import HttpResponse
+from admin.versions import catalog_versions
+
+PATH_KWARGS=("brand_code", "model_code", "category_code", "product_code")
+
+
+class LocalMemoryBackend:
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries=max_entries
+        self.ttl=ttl
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value=entry
+            if expires_at<time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key]=(time.monotonic()+self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias="default", ttl=300):
+        from django.core.cache import caches
+        self.cache=caches[alias]
+        self.ttl=ttl
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(list(keys))
+
+
+class ResponseCache:
+    def __init__(self, backend, max_entries=2048):
+        self.backend=backend
+        self.max_entries=max_entries
+        self.generation=0
+        self._paths=OrderedDict()
+        self._lock=threading.Lock()
+
+    @staticmethod
+    def key(request):
+        query="&".join(f"{key}={value}" for key, value in sorted(request.GET.items()))
+        return "catalog:"+hashlib.sha1(f"{request.path}?{query}".encode()).hexdigest()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def store(self, key, path, value, generation):
+        with self._lock:
+            if generation!=self.generation:
+                return False
+            self._paths[key]=path
+            self._paths.move_to_end(key)
+            while len(self._paths)>self.max_entries:
+                self._paths.popitem(last=False)
+        self.backend.set(key, value)
+        return True
+
+    def invalidate(self, path, descendants=True):
+        with self._lock:
+            self.generation+=1
+            keys=[
+                key for key, cached_path in self._paths.items()
+                if cached_path==path or (descendants and cached_path[:len(path)]==path)
+            ]
+            for key in keys:
+                del self._paths[key]
+        if keys:
+            self.backend.delete_many(keys)
+        return len(keys)
+
+    def invalidate_node(self, path):
+        if path is None:
+            return self.clear()
+        return self.invalidate(path[:-1], descendants=False)+self.invalidate(path)
+
+    def clear(self):
+        with self._lock:
+            self.generation+=1
+            keys=list(self._paths)
+            self._paths.clear()
+        if keys:
+            self.backend.delete_many(keys)
+        return len(keys)
+
+
+def build_response_cache():
+    config=settings.RESPONSE_CACHE
+    if config.get("BACKEND")=="django":
+        backend=DjangoCacheBackend(alias=config.get("ALIAS", "default"), ttl=config["TTL"])
+    else:
+        backend=LocalMemoryBackend(max_entries=config["MAX_ENTRIES"], ttl=config["TTL"])
+    return ResponseCache(backend, max_entries=config["MAX_ENTRIES"])
+
+
+response_cache=build_response_cache()
+
+
+def cached_catalog(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method!="GET" or not catalog_versions.live:
+            return view(request, *args, **kwargs)
+        key=response_cache.key(request)
+        cached=response_cache.get(key)
+        if cached is not None:
+            content, content_type=cached
+            return HttpResponse(content, content_type=content_type)
+        generation=response_cache.generation
+        response=view(request, *args, **kwargs)
+        if response.status_code==200:
+            if hasattr(response, "render"):
+                response.render()
+            path=tuple(kwargs[key] for key in PATH_KWARGS if key in kwargs)
+            response_cache.store(key, path, (response.content, response["Content-Type"]), generation)
+        return response
+    return wrapper
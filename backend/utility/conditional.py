@@ -0,0 +1,42 @@
+import hashlib
+import math
+from functools import wraps
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+from admin.versions import catalog_versions
+
+PATH_KWARGS=("brand_code", "model_code", "category_code")
+
+
+def catalog_etag(request, last_modified):
+    query="&".join(f"{key}={value}" for key, value in sorted(request.GET.items()))
+    raw=f"{request.path}?{query}|{last_modified.timestamp()}"
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+def not_modified(request, etag, last_modified):
+    if_none_match=request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        tags=[tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since=parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE", ""))
+    return if_modified_since is not None and math.floor(last_modified.timestamp())<=if_modified_since
+
+def conditional_catalog(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method!="GET" or not catalog_versions.live:
+            return view(request, *args, **kwargs)
+        path=tuple(kwargs[key] for key in PATH_KWARGS if key in kwargs)
+        last_modified=catalog_versions.last_modified(path)
+        etag=catalog_etag(request, last_modified)
+        headers={"ETag": etag, "Last-Modified": http_date(math.floor(last_modified.timestamp()))}
+        if not_modified(request, etag, last_modified):
+            response=HttpResponseNotModified()
+        else:
+            response=view(request, *args, **kwargs)
+            if response.status_code!=200:
+                return response
+        for key, value in headers.items():
+            response[key]=value
+        return response
+    return wrapper
@@ -0,0 +1,56 @@
+import base64
+from datetime import datetime
+from bson import ObjectId, json_util
+from bson.errors import InvalidBSON
+
+MAX_PAGE_SIZE=100
+CURSOR_TYPES=(str, int, float, datetime, type(None))
+
+
+def encode_cursor(sort_value, doc_id):
+    raw=json_util.dumps([sort_value, doc_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw=base64.urlsafe_b64decode(cursor+"="*(-len(cursor)%4))
+        sort_value, doc_id=json_util.loads(raw)
+    except (ValueError, TypeError, InvalidBSON):
+        raise ValueError("invalid cursor")
+    if not isinstance(doc_id, ObjectId) or not isinstance(sort_value, CURSOR_TYPES):
+        raise ValueError("invalid cursor")
+    return sort_value, doc_id
+
+def cursor_clause(sort_field, sort_value, last_id, direction=1):
+    op="$gt" if direction==1 else "$lt"
+    tie={sort_field: sort_value, "_id": {op: last_id}}
+    if sort_value is None:
+        return {"$or": [tie, {sort_field: {"$ne": None}}]} if direction==1 else tie
+    clauses=[{sort_field: {op: sort_value}}, tie]
+    if direction==-1:
+        clauses.append({sort_field: None})
+    return {"$or": clauses}
+
+def page_params(request, default_limit=20):
+    try:
+        limit=int(request.query_params.get("limit", default_limit))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit<1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE), request.query_params.get("cursor") or None
+
+def keyset_page(collection, query, sort_field, limit, cursor=None, direction=1, projection=None):
+    if cursor:
+        sort_value, last_id=decode_cursor(cursor)
+        query={"$and": [query, cursor_clause(sort_field, sort_value, last_id, direction)]}
+    docs=list(
+        collection.find(query, projection)
+        .sort([(sort_field, direction), ("_id", direction)])
+        .limit(limit+1)
+    )
+    next_cursor=None
+    if len(docs)>limit:
+        docs=docs[:limit]
+        next_cursor=encode_cursor(docs[-1].get(sort_field), docs[-1]["_id"])
+    return docs, next_cursor
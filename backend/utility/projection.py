@@ -0,0 +1,30 @@
+def field_params(request, allowed):
+    raw=request.query_params.get("fields")
+    if not raw:
+        return None
+    fields=[field.strip() for field in raw.split(",") if field.strip()]
+    unknown=[field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return ["_id"]+[field for field in fields if field!="_id"]
+
+def projection_for(fields, *required):
+    if not fields:
+        return None
+    projection={field: 1 for field in fields}
+    for field in required:
+        projection[field]=1
+    return projection
+
+def select_fields(data, fields):
+    if not fields:
+        return data
+    return {field: data[field] for field in fields}
+
+def flag_param(request, name):
+    return request.query_params.get(name, "false").strip().lower() in ("1", "true", "yes")
+
+def attach_counts(items, docs):
+    for item, doc in zip(items, docs):
+        item["product_count"]=doc.get("product_count") or 0
+    return items
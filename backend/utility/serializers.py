@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timezone
+from bson import ObjectId
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson=None
+
+
+def _ident(value):
+    return str(value) if value else None
+
+def _stamp(value):
+    return str(value or datetime.now(timezone.utc))
+
+def _list(value):
+    return value or []
+
+def _object(value):
+    return value or {}
+
+def _number(value):
+    return value or 0
+
+def _cart_items(items):
+    return [
+        {
+            "product_id": str(item["product_id"]),
+            "quantity": item["quantity"],
+            "added_at": _stamp(item.get("added_at")),
+        } for item in items or []
+    ]
+
+
+class DocumentSerializer:
+    def __init__(self, **converters):
+        self.converters=converters
+        self.items=tuple(converters.items())
+
+    def __call__(self, doc, fields=None):
+        get=doc.get
+        items=self.items if not fields else [(field, self.converters[field]) for field in fields]
+        return {field: (convert(get(field)) if convert else get(field)) for field, convert in items}
+
+
+serialize_brand=DocumentSerializer(
+    _id=_ident, brand_name=None, brand_code=None, image_url=None, created_at=_stamp,
+)
+serialize_model=DocumentSerializer(
+    _id=_ident, brand_id=str, model_name=None, model_code=None, image_url=None, created_at=_stamp,
+)
+serialize_category=DocumentSerializer(
+    _id=_ident, model_id=str, category_name=None, category_code=None, image_url=None, created_at=_stamp,
+)
+serialize_product=DocumentSerializer(
+    _id=_ident, category_id=str, brand_code=None, model_code=None, category_code=None,
+    product_name=None, product_code=None, code=None, description=None, price=None,
+    effective_price=None, stock=None, image_url=None, created_at=_stamp, reviews=_list, offers=_object,
+)
+serialize_cart=DocumentSerializer(
+    _id=_ident, user_id=str, items=_cart_items, subtotal=_number,
+    created_at=_stamp, updated_at=_stamp,
+)
+serialize_address=DocumentSerializer(
+    _id=_ident, user_id=str, name=None, phone_number=None, address_line1=None, address_line2=None,
+    city=None, state=None, country=None, pincode=None, updated_at=_stamp,
+)
+
+
+_encoder=JSONEncoder()
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    return _encoder.default(value)
+
+def dumps(data):
+    if orjson is not None:
+        raw=orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    else:
+        raw=json.dumps(data, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    if b"\xe2\x80" in raw:
+        raw=raw.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+    return raw
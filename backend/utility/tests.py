@@ -1,3 +1,172 @@
-from django.test import TestCase
+import base64
+from datetime import datetime, timezone
+from unittest import mock
+from bson import ObjectId, json_util
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.http import http_date
+from .conditional import conditional_catalog
+from .pagination import cursor_clause, decode_cursor, encode_cursor, keyset_page
+from .renderers import FastJSONRenderer
+from . import serializers
+from .serializers import dumps, serialize_cart, serialize_product
+from .views import batch_products
 
-# Create your tests here.
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json_util.dumps(value).encode()).decode()
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        doc_id=ObjectId()
+        at=datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        for value in ("BRK", 12, 9.5, at, None):
+            self.assertEqual(decode_cursor(encode_cursor(value, doc_id)), (value, doc_id))
+
+    def test_rejects_garbage(self):
+        for cursor in ("!!!", raw_cursor([1]), raw_cursor({"a": 1, "b": 2})):
+            with self.assertRaisesMessage(ValueError, "invalid cursor"):
+                decode_cursor(cursor)
+
+    def test_rejects_operator_documents(self):
+        for value in ([{"$ne": None}, str(ObjectId())], ["a", {"$ne": None}], [{"$regex": ".*"}, ObjectId()], [["a"], ObjectId()]):
+            with self.assertRaisesMessage(ValueError, "invalid cursor"):
+                decode_cursor(raw_cursor(value))
+
+
+class CursorClauseTests(SimpleTestCase):
+    def setUp(self):
+        self.last_id=ObjectId()
+
+    def test_ascending(self):
+        self.assertEqual(cursor_clause("price", 10, self.last_id), {"$or": [
+            {"price": {"$gt": 10}},
+            {"price": 10, "_id": {"$gt": self.last_id}},
+        ]})
+
+    def test_descending_reaches_missing_values(self):
+        self.assertEqual(cursor_clause("price", 10, self.last_id, -1), {"$or": [
+            {"price": {"$lt": 10}},
+            {"price": 10, "_id": {"$lt": self.last_id}},
+            {"price": None},
+        ]})
+
+    def test_ascending_from_null_boundary(self):
+        self.assertEqual(cursor_clause("price", None, self.last_id), {"$or": [
+            {"price": None, "_id": {"$gt": self.last_id}},
+            {"price": {"$ne": None}},
+        ]})
+
+    def test_descending_from_null_boundary(self):
+        self.assertEqual(cursor_clause("price", None, self.last_id, -1), {"price": None, "_id": {"$lt": self.last_id}})
+
+
+class KeysetPageTests(SimpleTestCase):
+    def test_next_cursor_points_at_last_returned_document(self):
+        docs=[{"_id": ObjectId(), "code": code} for code in ("A", "B", "C")]
+        collection=mock.MagicMock()
+        collection.find.return_value.sort.return_value.limit.return_value=docs
+        page, next_cursor=keyset_page(collection, {"x": 1}, "code", 2)
+        self.assertEqual(page, docs[:2])
+        self.assertEqual(decode_cursor(next_cursor), ("B", docs[1]["_id"]))
+        collection.find.return_value.sort.assert_called_with([("code", 1), ("_id", 1)])
+        collection.find.return_value.sort.return_value.limit.assert_called_with(3)
+
+    def test_cursor_is_applied_to_query(self):
+        last_id=ObjectId()
+        collection=mock.MagicMock()
+        collection.find.return_value.sort.return_value.limit.return_value=[]
+        keyset_page(collection, {"x": 1}, "code", 2, encode_cursor("B", last_id))
+        query=collection.find.call_args[0][0]
+        self.assertEqual(query, {"$and": [{"x": 1}, cursor_clause("code", "B", last_id)]})
+
+
+class ConditionalCatalogTests(SimpleTestCase):
+    def setUp(self):
+        self.factory=RequestFactory()
+        self.versions=mock.patch("utility.conditional.catalog_versions").start()
+        self.addCleanup(mock.patch.stopall)
+        self.versions.live=True
+        self.versions.last_modified.return_value=datetime(2025, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc)
+        self.view=conditional_catalog(lambda request, **kwargs: HttpResponse("body"))
+
+    def test_sets_validators(self):
+        response=self.view(self.factory.get("/api/brands/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Last-Modified"], "Thu, 02 Jan 2025 03:04:05 GMT")
+        self.assertTrue(response["ETag"].startswith('"'))
+
+    def test_if_modified_since_compares_whole_seconds(self):
+        since=http_date(datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc).timestamp())
+        response=self.view(self.factory.get("/api/brands/", HTTP_IF_MODIFIED_SINCE=since))
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_before_change(self):
+        since=http_date(datetime(2025, 1, 2, 3, 4, 4, tzinfo=timezone.utc).timestamp())
+        response=self.view(self.factory.get("/api/brands/", HTTP_IF_MODIFIED_SINCE=since))
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_none_match(self):
+        etag=self.view(self.factory.get("/api/brands/"))["ETag"]
+        response=self.view(self.factory.get("/api/brands/", HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+
+    def test_bypassed_when_not_live(self):
+        self.versions.live=False
+        response=self.view(self.factory.get("/api/brands/", HTTP_IF_MODIFIED_SINCE=http_date(2**31)))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class SerializerTests(SimpleTestCase):
+    def test_product_fields_and_defaults(self):
+        doc={"_id": ObjectId(), "category_id": ObjectId(), "product_code": "P1", "price": 10, "created_at": None}
+        data=serialize_product(doc)
+        self.assertEqual(list(data)[:3], ["_id", "category_id", "brand_code"])
+        self.assertEqual(data["_id"], str(doc["_id"]))
+        self.assertEqual(data["reviews"], [])
+        self.assertEqual(data["offers"], {})
+        self.assertIsInstance(data["created_at"], str)
+
+    def test_sparse_fields_keep_requested_order(self):
+        doc={"_id": ObjectId(), "price": 10, "product_code": "P1"}
+        self.assertEqual(serialize_product(doc, ["price", "_id"]), {"price": 10, "_id": str(doc["_id"])})
+
+    def test_cart_items(self):
+        product_id=ObjectId()
+        data=serialize_cart({"_id": ObjectId(), "user_id": ObjectId(), "items": [{"product_id": product_id, "quantity": 2}]})
+        self.assertEqual(data["items"][0]["product_id"], str(product_id))
+        self.assertEqual(data["subtotal"], 0)
+
+
+class DumpsTests(SimpleTestCase):
+    payload={"id": ObjectId("64b7f0c2a1b2c3d4e5f60718"), "at": datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), "text": "a\u2028b"}
+
+    def assert_dumps(self):
+        raw=dumps(self.payload)
+        self.assertNotIn("\u2028".encode(), raw)
+        self.assertEqual(json_util.loads(raw), {"id": "64b7f0c2a1b2c3d4e5f60718", "at": "2025-01-02T03:04:05Z", "text": "a\u2028b"})
+
+    def test_orjson(self):
+        if serializers.orjson is None:
+            self.skipTest("orjson not installed")
+        self.assert_dumps()
+
+    def test_stdlib_fallback(self):
+        with mock.patch.object(serializers, "orjson", None):
+            self.assert_dumps()
+
+    def test_renderer(self):
+        self.assertEqual(FastJSONRenderer().render({"a": 1}), b'{"a":1}')
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+
+class BatchProductsViewTests(SimpleTestCase):
+    def test_rejects_non_object_body(self):
+        request=RequestFactory().post("/api/utils/products/batch/", data=["a"], content_type="application/json")
+        with mock.patch("utility.views.Product.products_batch") as batch:
+            response=batch_products(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "request body must be a JSON object"})
+        batch.assert_not_called()
@@ -4,9 +4,15 @@ from .views import (
     list_models, fetch_model, search_model,
     list_categories, fetch_category, search_category,
     list_products, fetch_product, search_product,
+    global_search, autocomplete, catalog_snapshot_view, batch_products,
 )
 
 urlpatterns=[
+    path("search/", global_search, name="global_search"),
+    path("autocomplete/", autocomplete, name="autocomplete"),
+    path("catalog/snapshot/", catalog_snapshot_view, name="catalog_snapshot"),
+    path("products/batch/", batch_products, name="batch_products"),
+
     path("brands/", list_brands, name="list_brands"),
     path("brands/search/", search_brand, name="search_brands"),
     path("brands/<str:brand_code>/", fetch_brand, name="fetch_brand"),
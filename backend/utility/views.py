@@ -1,21 +1,35 @@
 from admin.views import *
 from admin.models import Brand, Model, Category, Product
+from admin.search import catalog_index
+from admin.snapshot import catalog_snapshot
 from .exceptions import handle_exceptions
+from .pagination import page_params
+from .projection import field_params, flag_param
+from .conditional import conditional_catalog
+from .cache import cached_catalog
+from django.http import HttpResponse, HttpResponseNotModified
 
 
+@conditional_catalog
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def list_brands(request):
-    limit=int(request.GET.get("limit", 20))
-    brands=Brand.brands_list(limit=limit)
-    return Response({"brands": brands}, status=status.HTTP_200_OK)
+    limit, cursor=page_params(request)
+    fields=field_params(request, Brand.public_fields)
+    include_counts=flag_param(request, "include_counts")
+    brands, next_cursor=Brand.brands_list(limit=limit, cursor=cursor, fields=fields, include_counts=include_counts)
+    return Response({"brands": brands, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def fetch_brand(request, brand_code):
-    brand = Brand.brand_fetch(brand_code)
+    fields=field_params(request, Brand.public_fields)
+    brand=Brand.brand_fetch(brand_code, fields=fields)
     return Response({"brand": brand}, status=status.HTTP_200_OK)
 
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def search_brand(request):
@@ -25,23 +39,33 @@ def search_brand(request):
             {"error": "missing required query parameter: q"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    results=Brand.brand_search(query)
-    return Response({"results": results}, status=status.HTTP_200_OK)
+    limit, cursor=page_params(request)
+    fields=field_params(request, Brand.public_fields)
+    results, next_cursor=Brand.brand_search(query, limit=limit, cursor=cursor, fields=fields)
+    return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
 
+@conditional_catalog
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def list_models(request, brand_code):
-    limit=int(request.GET.get("limit", 20))
-    models=Model.models_list(brand_code, limit=limit)
-    return Response({"models": models}, status=status.HTTP_200_OK)
-
+    limit, cursor=page_params(request)
+    fields=field_params(request, Model.public_fields)
+    include_counts=flag_param(request, "include_counts")
+    models, next_cursor=Model.models_list(
+        brand_code, limit=limit, cursor=cursor, fields=fields, include_counts=include_counts)
+    return Response({"models": models, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def fetch_model(request, brand_code, model_code):
-    model=Model.model_fetch(brand_code, model_code)
+    fields=field_params(request, Model.public_fields)
+    model=Model.model_fetch(brand_code, model_code, fields=fields)
     return Response({"model": model}, status=status.HTTP_200_OK)
 
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def search_model(request, brand_code):
@@ -51,23 +75,33 @@ def search_model(request, brand_code):
             {"error": "missing required query parameter: q"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    results=Model.model_search(brand_code, query)
-    return Response({"results": results}, status=status.HTTP_200_OK)
+    limit, cursor=page_params(request)
+    fields=field_params(request, Model.public_fields)
+    results, next_cursor=Model.model_search(brand_code, query, limit=limit, cursor=cursor, fields=fields)
+    return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
 
+@conditional_catalog
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def list_categories(request, brand_code, model_code):
-    limit=int(request.GET.get("limit", 20))
-    categories=Category.categories_list(brand_code, model_code, limit=limit)
-    return Response({"categories": categories}, status=status.HTTP_200_OK)
-
+    limit, cursor=page_params(request)
+    fields=field_params(request, Category.public_fields)
+    include_counts=flag_param(request, "include_counts")
+    categories, next_cursor=Category.categories_list(
+        brand_code, model_code, limit=limit, cursor=cursor, fields=fields, include_counts=include_counts)
+    return Response({"categories": categories, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def fetch_category(request, brand_code, model_code, category_code):
-    category=Category.category_fetch(brand_code, model_code, category_code)
+    fields=field_params(request, Category.public_fields)
+    category=Category.category_fetch(brand_code, model_code, category_code, fields=fields)
     return Response({"category": category}, status=status.HTTP_200_OK)
 
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def search_category(request, brand_code, model_code):
@@ -77,23 +111,39 @@ def search_category(request, brand_code, model_code):
             {"error": "missing required query parameter: q"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    results=Category.category_search(brand_code, model_code, query)
-    return Response({"results": results}, status=status.HTTP_200_OK)
+    limit, cursor=page_params(request)
+    fields=field_params(request, Category.public_fields)
+    results, next_cursor=Category.category_search(brand_code, model_code, query, limit=limit, cursor=cursor, fields=fields)
+    return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
 
 
+@conditional_catalog
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def list_products(request, brand_code, model_code, category_code):
-    limit=int(request.GET.get("limit", 20))
-    products=Product.products_list(brand_code, model_code, category_code, limit=limit)
-    return Response({"products": products}, status=status.HTTP_200_OK)
-
+    limit, cursor=page_params(request)
+    fields=field_params(request, Product.public_fields)
+    filters=Product.list_filters(
+        min_price=request.query_params.get("min_price"),
+        max_price=request.query_params.get("max_price"),
+        in_stock=flag_param(request, "in_stock"),
+        on_offer=flag_param(request, "on_offer"),
+    )
+    sort=request.query_params.get("sort", "code")
+    products, next_cursor=Product.products_list(
+        brand_code, model_code, category_code, limit=limit, cursor=cursor, fields=fields, filters=filters, sort=sort)
+    return Response({"products": products, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def fetch_product(request, brand_code, model_code, category_code, product_code):
-    product=Product.product_fetch(brand_code, model_code, category_code, product_code)
+    fields=field_params(request, Product.public_fields)
+    product=Product.product_fetch(brand_code, model_code, category_code, product_code, fields=fields)
     return Response({"product": product}, status=status.HTTP_200_OK)
 
+@cached_catalog
 @api_view(["GET"])
 @handle_exceptions
 def search_product(request, brand_code, model_code, category_code):
@@ -103,5 +153,67 @@ def search_product(request, brand_code, model_code, category_code):
             {"error": "missing required query parameter: q"},
             status=status.HTTP_400_BAD_REQUEST
         )
-    results=Product.product_search(brand_code, model_code, category_code, query)
-    return Response({"results": results}, status=status.HTTP_200_OK)
\ No newline at end of file
+    limit, cursor=page_params(request)
+    fields=field_params(request, Product.public_fields)
+    mode=request.query_params.get("mode", "regex")
+    results, next_cursor=Product.product_search(
+        brand_code, model_code, category_code, query, limit=limit, cursor=cursor, fields=fields, mode=mode)
+    return Response({"results": results, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+
+@api_view(["POST"])
+@handle_exceptions
+def batch_products(request):
+    if not isinstance(request.data, dict):
+        raise ValueError("request body must be a JSON object")
+    fields=field_params(request, Product.public_fields)
+    products, missing=Product.products_batch(
+        ids=request.data.get("ids"), codes=request.data.get("codes"), fields=fields)
+    return Response({"products": products, "missing": missing}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@handle_exceptions
+def global_search(request):
+    query=request.query_params.get("q", "").strip("/")
+    if not query:
+        return Response(
+            {"error": "missing required query parameter: q"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    limit, _=page_params(request)
+    results=catalog_index.search(query, limit=limit)
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+@api_view(["GET"])
+@handle_exceptions
+def autocomplete(request):
+    query=request.query_params.get("q", "")
+    if not query.strip():
+        return Response(
+            {"error": "missing required query parameter: q"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    limit, _=page_params(request, default_limit=10)
+    types=[t.strip() for t in request.query_params.get("type", "").split(",") if t.strip()]
+    unknown=[t for t in types if t not in catalog_index.rank]
+    if unknown:
+        raise ValueError(f"unknown type: {', '.join(unknown)}")
+    results=catalog_index.autocomplete(query, limit=limit, types=types or None)
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+@api_view(["GET"])
+@handle_exceptions
+def catalog_snapshot_view(request):
+    products=flag_param(request, "products")
+    raw, compressed, etag=catalog_snapshot.get(products=products)
+    if_none_match=request.META.get("HTTP_IF_NONE_MATCH", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        response=HttpResponseNotModified()
+    elif "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+        response=HttpResponse(compressed, content_type="application/json")
+        response["Content-Encoding"]="gzip"
+    else:
+        response=HttpResponse(raw, content_type="application/json")
+    response["ETag"]=etag
+    response["Vary"]="Accept-Encoding"
+    return response
\ No newline at end of file